@@ -1,8 +1,32 @@
 from typing import Tuple
 
+import numpy as np
+
+# Layout of the states buffer: positions, velocities and accelerations of the five actuators
+STATE_COUNT = 15
+POSITIONS = slice(0, 5)
+VELOCITIES = slice(5, 10)
+ACCELERATIONS = slice(10, 15)
+
+
+def state_property(index: int) -> property:
+    """Expose an element of the states buffer as a float attribute"""
+    def get_state(self) -> float:
+        return self._states.item(index)
+
+    def set_state(self, value: float) -> None:
+        self._states[index] = value
+
+    return property(get_state, set_state)
+
 
 class ActuatorStates(object):
-    """Define the actuator states of the robot"""
+    """
+    Define the actuator states of the robot
+    The states are stored in a single float64 buffer, laid out as positions, velocities and accelerations
+    """
+    __slots__ = ("_states",)
+
     def __init__(self,
                  d_1: float, theta_1: float, theta_2: float, theta_3: float, l_6: float,
                  d_1_v: float = 0.0, theta_1_v: float = 0.0, theta_2_v: float = 0.0, theta_3_v: float = 0.0,
@@ -10,33 +34,72 @@ class ActuatorStates(object):
                  d_1_a: float = 0.0, theta_1_a: float = 0.0, theta_2_a: float = 0.0, theta_3_a: float = 0.0,
                  l_6_a: float = 0.0):
         """Initialise Actuator position, velocity and acceleration"""
-        self.d_1 = d_1          # lift in mm
-        self.theta_1 = theta_1  # swing in degrees
-        self.theta_2 = theta_2  # elbow rotation in degrees
-        self.theta_3 = theta_3  # wrist rotation in degrees
-        self.l_6 = l_6          # jaw opening in mm
-
-        self.d_1_v = d_1_v
-        self.theta_1_v = theta_1_v
-        self.theta_2_v = theta_2_v
-        self.theta_3_v = theta_3_v
-        self.l_6_v = l_6_v
-
-        self.d_1_a = d_1_a
-        self.theta_1_a = theta_1_a
-        self.theta_2_a = theta_2_a
-        self.theta_3_a = theta_3_a
-        self.l_6_a = l_6_a
+        self._states = np.array([d_1, theta_1, theta_2, theta_3, l_6,
+                                 d_1_v, theta_1_v, theta_2_v, theta_3_v, l_6_v,
+                                 d_1_a, theta_1_a, theta_2_a, theta_3_a, l_6_a], dtype=float)
+
+    d_1 = state_property(0)       # lift in mm
+    theta_1 = state_property(1)   # swing in degrees
+    theta_2 = state_property(2)   # elbow rotation in degrees
+    theta_3 = state_property(3)   # wrist rotation in degrees
+    l_6 = state_property(4)       # jaw opening in mm
+
+    d_1_v = state_property(5)
+    theta_1_v = state_property(6)
+    theta_2_v = state_property(7)
+    theta_3_v = state_property(8)
+    l_6_v = state_property(9)
+
+    d_1_a = state_property(10)
+    theta_1_a = state_property(11)
+    theta_2_a = state_property(12)
+    theta_3_a = state_property(13)
+    l_6_a = state_property(14)
+
+    @property
+    def positions(self) -> np.ndarray:
+        """View on the positions, updating it updates the states in place"""
+        return self._states[POSITIONS]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        """View on the velocities, updating it updates the states in place"""
+        return self._states[VELOCITIES]
+
+    @property
+    def accelerations(self) -> np.ndarray:
+        """View on the accelerations, updating it updates the states in place"""
+        return self._states[ACCELERATIONS]
 
     def get_states(self) -> Tuple[float, float, float, float, float]:
-        return self.d_1, self.theta_1, self.theta_2, self.theta_3, self.l_6
+        return tuple(self._states[POSITIONS].tolist())
+
+    def get_velocities(self) -> Tuple[float, float, float, float, float]:
+        return tuple(self._states[VELOCITIES].tolist())
+
+    def to_array(self) -> np.ndarray:
+        """Get the states buffer itself, without copying"""
+        return self._states
 
     def reset_vel_and_acc(self):
-        self.d_1_v, self.theta_1_v, self.theta_2_v, self.theta_3_v, self.l_6_v = 0.0, 0.0, 0.0, 0.0, 0.0
-        self.d_1_a, self.theta_1_a, self.theta_2_a, self.theta_3_a, self.l_6_a = 0.0, 0.0, 0.0, 0.0, 0.0
+        self._states[VELOCITIES.start:] = 0.0
 
     def __str__(self) -> str:
         return (f"ActuatorStates("
                 f"Position: d_1={self.d_1}, theta_1={self.theta_1}, theta_2={self.theta_2}, theta_3={self.theta_3}, l_6={self.l_6}; "
                 f"Velocity: d_1_v={self.d_1_v}, theta_1_v={self.theta_1_v}, theta_2_v={self.theta_2_v}, theta_3_v={self.theta_3_v}, l_6_v={self.l_6_v}; "
                 f"Acceleration: d_1_a={self.d_1_a}, theta_1_a={self.theta_1_a}, theta_2_a={self.theta_2_a}, theta_3_a={self.theta_3_a}, l_6_a={self.l_6_a})")
+
+
+def from_array(states: np.ndarray, copy: bool = False) -> ActuatorStates:
+    """
+    Create actuator states backed by a float64 buffer of 15 states, e.g. a row of a (robots, 15) array
+    Without copying, the actuator states and the buffer share memory
+    """
+    states = np.asarray(states, dtype=float)
+    if states.shape != (STATE_COUNT,):
+        raise ValueError(f"Actuator states need {STATE_COUNT} values, got shape {states.shape}")
+
+    act_states = ActuatorStates.__new__(ActuatorStates)
+    act_states._states = states.copy() if copy else states
+    return act_states
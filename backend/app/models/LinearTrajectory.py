@@ -0,0 +1,149 @@
+from time import perf_counter
+
+from backend.app.models.ActuatorStates import ActuatorStates, from_array
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.Metrics import INVERSE_KINEMATICS_SECONDS
+from backend.app.services.tools.KinematicsHelper import calculate_jaw_opening
+from backend.app.services.tools.TrajectoryHelper import *
+
+# Swing and wrist rotation, solved by inverse kinematics within +- 180 degrees
+ANGLES = [1, 3]
+
+
+class LinearTrajectory(object):
+    """
+    Defining a straight-line trajectory for the robot end effector
+    The end-effector pose is interpolated in Cartesian space and the actuator states along the line are solved with
+    batched inverse kinematics. The whole line is validated, and the moving time respects the limits of the end effector
+    as well as those of the actuators, before the robot moves
+    """
+
+    def __init__(self, robot: RobotCrane, pose_t_1: tuple, do_open_gripper: bool = True, samples: int = 200):
+        self.robot = robot
+        self.do_open_gripper = do_open_gripper
+        self.act_states_t_0 = robot.act_states_t_0
+
+        # The line runs from the current end effector, at the jaw opening of the end of the line
+        x, y, z, phi = robot.get_end_effector_pose()
+        jaw_offset = calculate_jaw_opening(do_open_gripper) - self.act_states_t_0.l_6
+        self.pose_t_0 = np.array([x + jaw_offset * np.cos(phi), y + jaw_offset * np.sin(phi), z, phi])
+        self.pose_t_1 = np.asarray(pose_t_1, dtype=float)
+
+        # Stay in the elbow configuration of the robot
+        self.elbow_up = bool(self.act_states_t_0.theta_2 >= 0)
+
+        self.max_velocities = np.array([robot.max_vel, robot.max_ang_vel, robot.max_ang_vel, robot.max_ang_vel,
+                                        robot.max_vel])
+        self.max_accelerations = np.array([robot.max_acc, robot.max_ang_acc, robot.max_ang_acc, robot.max_ang_acc,
+                                           robot.max_acc])
+
+        # Actuator states along the whole line, at equal steps of time
+        self.__times = np.linspace(0, 1, samples + 1)
+        self.__path = calculate_position(0.0, 0.0, 3.0, -2.0, self.__times)
+        self.__offset = np.zeros(5)
+        self.__reference_states = self.plan_reference()
+
+        self.__moving_time = self.min_move_time
+        self.act_states_t_1 = ActuatorStates(*self.__reference_states[-1].tolist())
+
+    @property
+    def min_move_time(self) -> float:
+        t_min_position = calculate_minimum_move_time(self.robot.max_vel, self.robot.max_acc, 0,
+                                                     np.linalg.norm(self.pose_t_1[0:3] - self.pose_t_0[0:3]))
+        t_min_phi = calculate_minimum_move_time(self.robot.max_ang_vel, self.robot.max_ang_acc, self.pose_t_0[3],
+                                                self.pose_t_1[3])
+
+        # Actuator velocities scale with 1 / moving time, and accelerations with 1 / moving time ** 2. They are taken
+        # the way they are sampled, as differences of the reference states underestimate sharp peaks near singularities
+        _, velocities, accelerations = self.sample_line(self.__times, 1.0)
+        t_min_act_vel = (np.abs(velocities).max(axis=0) / self.max_velocities).max()
+        t_min_act_acc = np.sqrt((np.abs(accelerations).max(axis=0) / self.max_accelerations).max())
+
+        return max(t_min_position, t_min_phi, t_min_act_vel.item(), t_min_act_acc.item())
+
+    def get_moving_time(self) -> float:
+        return self.__moving_time
+
+    def set_moving_time(self, time: float) -> None:
+        self.__moving_time = time
+
+    def solve_inverse_kinematics(self, path: np.ndarray) -> np.ndarray:
+        """Solve the (N, 5) actuator states at (N,) positions along the line, from 0 at the start to 1 at the end"""
+        poses = self.pose_t_0 + path[:, np.newaxis] * (self.pose_t_1 - self.pose_t_0)
+
+        # The limits are validated once the angles are continuous
+        start = perf_counter()
+        act_states, reachable = self.robot.inverse_kinematics_batch(poses, None, self.do_open_gripper, self.elbow_up,
+                                                                    validate=False)
+        INVERSE_KINEMATICS_SECONDS.observe_batch(perf_counter() - start, len(poses))
+        if not reachable.all():
+            raise ValueError(f"Position out of reach: straight line leaves the workspace at "
+                             f"{path[np.argmin(reachable)]:.0%} of the line")
+
+        return act_states
+
+    def plan_reference(self) -> np.ndarray:
+        """Solve the actuator states along the whole line, with continuous angles starting at the current states"""
+        act_states = self.solve_inverse_kinematics(self.__path)
+        current = np.asarray(self.act_states_t_0.get_states())
+
+        act_states[:, ANGLES] = np.unwrap(act_states[:, ANGLES], axis=0)
+        act_states[:, ANGLES] -= 2 * np.pi * np.round((act_states[0, ANGLES] - current[ANGLES]) / (2 * np.pi))
+
+        # Start exactly at the current actuator states, this also moves the jaw to its new opening
+        self.__offset = current - act_states[0]
+        act_states += np.outer(1 - self.__path, self.__offset)
+
+        if not self.robot.validate_act_states_batch(act_states).all():
+            raise ValueError("Position out of reach: straight line exceeds the actuator limits")
+
+        return act_states
+
+    def solve(self, path: np.ndarray) -> np.ndarray:
+        """Solve the actuator states at positions along the line, continuous with the reference states"""
+        act_states = self.solve_inverse_kinematics(path)
+
+        reference = np.stack([np.interp(path, self.__path, self.__reference_states[:, i]) for i in ANGLES], axis=1)
+        act_states[:, ANGLES] -= 2 * np.pi * np.round((act_states[:, ANGLES] - reference) / (2 * np.pi))
+
+        return act_states + np.outer(1 - path, self.__offset)
+
+    def next_step(self, t: float) -> ActuatorStates | None:
+        if t >= self.__moving_time:
+            return None
+
+        return self.calculate_next_step(t)
+
+    def calculate_next_step(self, t: float) -> ActuatorStates:
+        positions, velocities, accelerations = self.sample(np.array([t]))
+
+        return from_array(np.concatenate((positions[0], velocities[0], accelerations[0])))
+
+    def sample(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sample position, velocity and acceleration of all joints at all times, each as a (times, joints) array"""
+        moving_time = self.__moving_time
+        if moving_time > 0:
+            return self.sample_line(np.clip(np.asarray(times, dtype=float) / moving_time, 0, 1), moving_time)
+
+        positions, velocities, accelerations = self.sample_line(np.ones(len(times)), 1.0)
+        return positions, np.zeros(velocities.shape), np.zeros(accelerations.shape)
+
+    def sample_line(self, t: np.ndarray, moving_time: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sample the actuator states at (N,) fractions of the moving time, for the given moving time"""
+        # Position along the line and its derivatives to time
+        path = calculate_position(0.0, 0.0, 3.0, -2.0, t)
+        path_v = calculate_velocity(0.0, 3.0, -2.0, t) / moving_time
+        path_a = calculate_acceleration(3.0, -2.0, t) / moving_time ** 2
+
+        # Derivatives of the actuator states to the position along the line, by central differences within the line
+        h = 1e-4
+        center = np.clip(path, h, 1 - h)
+        positions, before, at_center, after = np.split(self.solve(np.concatenate((path, center - h, center,
+                                                                                  center + h))), 4)
+        derivative = (after - before) / (2 * h)
+        second_derivative = (after - 2 * at_center + before) / h ** 2
+
+        velocities = derivative * path_v[:, np.newaxis]
+        accelerations = second_derivative * path_v[:, np.newaxis] ** 2 + derivative * path_a[:, np.newaxis]
+
+        return positions, velocities, accelerations
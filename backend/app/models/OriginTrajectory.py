@@ -17,6 +17,7 @@ class OriginTrajectory(object):
         self.max_ang_acc = max_ang_acc
 
         self.__moving_time = self.min_move_time
+        self.__coefficients = get_coefficients_array(self.origin_t_0, self.origin_t_1, np.zeros(4), self.__moving_time)
 
     @property
     def min_move_time(self) -> float:
@@ -28,21 +29,26 @@ class OriginTrajectory(object):
 
         return max(t_min_org_x, t_min_org_y, t_min_org_z, t_min_org_phi)
 
+    @property
+    def coefficients(self) -> np.ndarray:
+        """Trajectory formula coefficients as a (4, 4) array, ordered as x, y, z and phi"""
+        return self.__coefficients
+
     @property
     def x_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.origin_t_0[0], self.origin_t_1[0], 0, self.min_move_time)
+        return tuple(self.__coefficients[0])
 
     @property
     def y_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.origin_t_0[1], self.origin_t_1[1], 0, self.min_move_time)
+        return tuple(self.__coefficients[1])
 
     @property
     def z_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.origin_t_0[2], self.origin_t_1[2], 0, self.min_move_time)
+        return tuple(self.__coefficients[2])
 
     @property
     def phi_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.origin_t_0[3], self.origin_t_1[3], 0, self.min_move_time)
+        return tuple(self.__coefficients[3])
 
     def get_moving_time(self) -> float:
         return self.__moving_time
@@ -54,9 +60,10 @@ class OriginTrajectory(object):
         return self.calculate_next_step(t)
 
     def calculate_next_step(self, t: float) -> Tuple[float, float, float, float]:
-        org_x = calculate_position(*self.x_coefficients, t)
-        org_y = calculate_position(*self.y_coefficients, t)
-        org_z = calculate_position(*self.z_coefficients, t)
-        org_phi = calculate_position(*self.phi_coefficients, t)
+        positions, _, _ = self.sample(np.array([t]))
+
+        return tuple(positions[0].tolist())
 
-        return org_x, org_y, org_z, org_phi
+    def sample(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sample position, velocity and acceleration of the origin at all times, each as a (times, 4) array"""
+        return calculate_positions_velocities_accelerations(self.__coefficients, times)
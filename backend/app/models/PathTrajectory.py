@@ -0,0 +1,109 @@
+from backend.app.models.ActuatorStates import ActuatorStates, from_array
+from backend.app.services.tools.TrajectoryHelper import *
+
+
+class PathTrajectory(object):
+    """
+    Defining a blended trajectory for the robot through a list of waypoints
+    Every segment between two waypoints is a cubic, intermediate waypoints are passed with a nonzero velocity so the
+    robot does not stop at every waypoint. The segment durations are shortened as far as the max velocity and
+    acceleration of the actuators allow
+    """
+
+    def __init__(self, waypoints: list[ActuatorStates], max_vel: float, max_acc: float, max_ang_vel: float,
+                 max_ang_acc: float, max_iterations: int = 50):
+        if len(waypoints) < 2:
+            raise ValueError("A path needs at least two waypoints")
+
+        # Limits per joint, ordered as the actuator states
+        self.max_velocities = np.array([max_vel, max_ang_vel, max_ang_vel, max_ang_vel, max_vel])
+        self.max_accelerations = np.array([max_acc, max_ang_acc, max_ang_acc, max_ang_acc, max_acc])
+        self.max_iterations = max_iterations
+
+        # The path starts from the velocity of the first waypoint, waypoints that do not move are skipped
+        self.start_velocities = np.asarray(waypoints[0].get_velocities())
+        positions = np.array([waypoint.get_states() for waypoint in waypoints])
+        moves = np.any(np.diff(positions, axis=0) != 0, axis=1)
+        self.waypoints = positions[np.concatenate(([True], moves))] if moves.any() else positions[[0, -1]]
+
+        self.__durations, self.__via_velocities, self.__coefficients = self.plan()
+        self.__start_times = np.concatenate(([0.0], np.cumsum(self.__durations)[:-1]))
+        self.__moving_time = float(self.__durations.sum())
+
+    @property
+    def min_move_time(self) -> float:
+        return self.__moving_time
+
+    @property
+    def durations(self) -> np.ndarray:
+        """Duration of every segment"""
+        return self.__durations
+
+    @property
+    def via_velocities(self) -> np.ndarray:
+        """(waypoints, joints) velocities at the waypoints"""
+        return self.__via_velocities
+
+    @property
+    def coefficients(self) -> np.ndarray:
+        """Trajectory formula coefficients as a (segments, joints, 4) array, ordered as the actuator states"""
+        return self.__coefficients
+
+    def calculate_minimum_durations(self) -> np.ndarray:
+        """Lower bound of the segment durations: cruising at max velocity, or accelerating and braking at max"""
+        distances = np.abs(np.diff(self.waypoints, axis=0))
+        return np.maximum(distances / self.max_velocities, 2 * np.sqrt(distances / self.max_accelerations)).max(axis=1)
+
+    def plan(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Plan the segment durations, via velocities and coefficients
+        Starting from the lower bound, segments that exceed a limit are stretched until all segments are within limits
+        """
+        durations = self.calculate_minimum_durations()
+        moving = durations > 0
+
+        for _ in range(self.max_iterations):
+            velocities = calculate_via_velocities(self.waypoints, np.where(moving, durations, 1.0),
+                                                  self.start_velocities)
+            coefficients = get_coefficients_array(self.waypoints[:-1], self.waypoints[1:], velocities[:-1],
+                                                  durations[:, np.newaxis], velocities[1:])
+
+            # Stretching a segment by a factor scales its velocities down by that factor and accelerations by its square
+            peak_velocities, peak_accelerations = calculate_peak_velocities_accelerations(coefficients, durations)
+            scales = np.maximum(peak_velocities / self.max_velocities,
+                                np.sqrt(peak_accelerations / self.max_accelerations)).max(axis=1)
+            scales = np.where(moving, scales, 1.0)
+
+            if np.all(scales <= 1 + 1e-6):
+                break
+
+            durations = durations * np.maximum(scales, 1.0)
+
+        return durations, velocities, coefficients
+
+    def get_moving_time(self) -> float:
+        return self.__moving_time
+
+    def next_step(self, t: float) -> ActuatorStates | None:
+        if t >= self.__moving_time:
+            return None
+
+        return self.calculate_next_step(t)
+
+    def calculate_next_step(self, t: float) -> ActuatorStates:
+        positions, velocities, accelerations = self.sample(np.array([t]))
+
+        return from_array(np.concatenate((positions[0], velocities[0], accelerations[0])))
+
+    def sample(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sample position, velocity and acceleration of all joints at all times, each as a (times, joints) array"""
+        t = np.clip(np.asarray(times, dtype=float), 0, self.__moving_time)
+
+        segments = np.searchsorted(self.__start_times, t, side='right') - 1
+        segments = np.clip(segments, 0, len(self.__durations) - 1)
+        local_t = (t - self.__start_times[segments])[:, np.newaxis]
+
+        a_0, a_1, a_2, a_3 = np.moveaxis(self.__coefficients[segments], -1, 0)
+
+        return calculate_position(a_0, a_1, a_2, a_3, local_t), calculate_velocity(a_1, a_2, a_3, local_t), \
+            calculate_acceleration(a_2, a_3, local_t)
@@ -0,0 +1,60 @@
+import numpy as np
+
+from backend.app.models.ActuatorStates import ActuatorStates, from_array, POSITIONS, VELOCITIES, ACCELERATIONS
+from backend.app.services.FrameScheduler import TIME_TOLERANCE
+
+
+class PoseBuffer(object):
+    """
+    Defining a precomputed robot motion for playback
+    Every frame holds the actuator states, the origin and the xyz coordinates of all the joints,
+    so playing the motion back only requires indexing on the elapsed time
+    """
+
+    def __init__(self, times: np.ndarray, positions: np.ndarray, velocities: np.ndarray, accelerations: np.ndarray,
+                 origins: np.ndarray, frames: np.ndarray, control_metrics: tuple = None):
+        self.times = times      # (frames,) in seconds
+        self.origins = origins  # (frames, 4) origin x, y, z and phi
+
+        # Actuator states laid out as in ActuatorStates, (frames, 15)
+        self.states = np.concatenate((positions, velocities, accelerations), axis=1)
+        self.positions = self.states[:, POSITIONS]
+        self.velocities = self.states[:, VELOCITIES]
+        self.accelerations = self.states[:, ACCELERATIONS]
+
+        # Only the joint coordinates and rotation angles are needed for rendering
+        self.joints = np.ascontiguousarray(frames[:, :, 0:3, 3])  # (frames, 7, 3)
+        self.angles = np.stack((origins[:, 3], positions[:, 1], positions[:, 2], positions[:, 3]), axis=1)
+
+        # Optional (frames, 4) end effector, target, control signals and errors of a controlled motion
+        self.control_metrics = control_metrics
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def get_moving_time(self) -> float:
+        return self.times[-1].item()
+
+    def get_index(self, elapsed_time_in_seconds: float) -> int:
+        """Get the index of the last frame at or before the elapsed time"""
+        index = np.searchsorted(self.times, elapsed_time_in_seconds + TIME_TOLERANCE, side='right') - 1
+        return int(min(max(index, 0), len(self.times) - 1))
+
+    def get_origin(self, index: int) -> tuple:
+        return tuple(self.origins[index].tolist())
+
+    def get_actuator_states(self, index: int) -> ActuatorStates:
+        return from_array(self.states[index], copy=True)
+
+    def get_control_metrics(self, index: int) -> tuple | None:
+        if self.control_metrics is None:
+            return None
+        return tuple(metric[index] for metric in self.control_metrics)
+
+    def get_pose_data(self, index: int) -> dict:
+        """Get the pose of a frame, with the same fields as the Pose model"""
+        j_1, j_2, j_3, j_4, j_5, j_6, j_7 = self.joints[index].tolist()
+        theta_0, theta_1, theta_2, theta_3 = self.angles[index].tolist()
+
+        return {"j_1": j_1, "j_2": j_2, "j_3": j_3, "j_4": j_4, "j_5": j_5, "j_6": j_6, "j_7": j_7,
+                "theta_0": theta_0, "theta_1": theta_1, "theta_2": theta_2, "theta_3": theta_3}
@@ -0,0 +1,47 @@
+import numpy as np
+
+from backend.app.services.FrameScheduler import TIME_TOLERANCE
+from backend.app.services.MotionRecorder import load_recording
+
+
+class RecordedMotion(object):
+    """
+    Defining a motion of a recording for replay
+    The channels are memory-mapped, so only the frames that are replayed are read from disk
+    """
+
+    def __init__(self, path: str, motion: int = 0):
+        index, channels = load_recording(path)
+        if not 0 <= motion < len(index["motions"]):
+            raise ValueError(f"Unknown motion {motion}, the recording has {len(index['motions'])} motions")
+
+        start = index["motions"][motion]["start"]
+        end = index["motions"][motion]["end"]
+        end = index["frame_count"] if end is None else min(end, index["frame_count"])
+        if end <= start:
+            raise ValueError(f"Motion {motion} has no recorded frames")
+
+        self.kind = index["motions"][motion]["kind"]
+        self.times = channels["time"][start:end]
+        self.origins = channels["origin"][start:end]
+        self.act_states = channels["act_states"][start:end]
+        self.joints = channels["joints"][start:end]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def get_moving_time(self) -> float:
+        return self.times[-1].item()
+
+    def get_index(self, elapsed_time_in_seconds: float) -> int:
+        """Get the index of the last frame at or before the elapsed time, a binary search only reads a few pages"""
+        index = np.searchsorted(self.times, elapsed_time_in_seconds + TIME_TOLERANCE, side='right') - 1
+        return int(min(max(index, 0), len(self.times) - 1))
+
+    def get_pose_data(self, index: int) -> dict:
+        """Get the pose of a frame, with the same fields as the Pose model"""
+        j_1, j_2, j_3, j_4, j_5, j_6, j_7 = self.joints[index].tolist()
+        _, theta_1, theta_2, theta_3, _ = self.act_states[index, 0:5].tolist()
+
+        return {"j_1": j_1, "j_2": j_2, "j_3": j_3, "j_4": j_4, "j_5": j_5, "j_6": j_6, "j_7": j_7,
+                "theta_0": self.origins[index, 3].item(), "theta_1": theta_1, "theta_2": theta_2, "theta_3": theta_3}
@@ -1,6 +1,12 @@
+from time import perf_counter
+
 from backend.app.models.Dimensions import Dimensions
+from backend.app.services.Metrics import FORWARD_KINEMATICS_SECONDS, INVERSE_KINEMATICS_SECONDS
 from backend.app.services.tools.KinematicsHelper import *
 
+# Relative tolerance of the velocity and acceleration limits, planned motions reach the limits up to rounding
+LIMIT_TOLERANCE = 1e-3
+
 
 class RobotCrane(object):
 
@@ -27,6 +33,10 @@ class RobotCrane(object):
         self.act_states_t_0 = ActuatorStates(0.7, np.deg2rad(0), np.deg2rad(0), np.deg2rad(0), 0.1)
         self.act_states_t_1 = ActuatorStates(0.7, np.deg2rad(0), np.deg2rad(0), np.deg2rad(0), 0.1)
 
+        # Frames of the latest evaluated pose, keyed on the origin and actuator positions
+        self.__frames_key = None
+        self.__frames = None
+
     @property
     def denavit_hartenberg_parameters(self) -> np.ndarray:
         return calculate_dh_parameters(self.__dimensions.l_2, self.__dimensions.l_3, self.__dimensions.d_4,
@@ -42,6 +52,7 @@ class RobotCrane(object):
 
     def set_origin_t_1(self, origin: tuple) -> None:
         self.origin_t_1 = origin
+        self.__frames_key = None
 
     def set_act_states_t_0(self, act_states: ActuatorStates) -> None:
         self.act_states_t_0 = act_states
@@ -49,6 +60,7 @@ class RobotCrane(object):
     def set_act_states_t_1(self, act_states: ActuatorStates) -> None:
         self.validate_act_states(act_states)
         self.act_states_t_1 = act_states
+        self.__frames_key = None
 
     def validate_act_states(self, act_states: ActuatorStates) -> None:
         """Validate actuator states according to robot dimensions"""
@@ -68,13 +80,42 @@ class RobotCrane(object):
             raise ValueError("Position out of reach: Theta 2 is out of bounds")
 
         # Wrist angle should not be greater than +- 360 degrees
-        if not (self.__min_angle <= act_states.theta_1 <= self.__max_angle):
+        if not (self.__min_angle <= act_states.theta_3 <= self.__max_angle):
             raise ValueError("Position out of reach: Theta 3 is out of bounds")
 
         # Jaw extensions should not be greater than the max jaw extensions
         if not (-self.__dimensions.l_7 <= act_states.l_6 <= self.__dimensions.l_7):
             raise ValueError("Position out of reach: L6 is out of bounds")
 
+    def validate_act_states_batch(self, act_states: np.ndarray) -> np.ndarray:
+        """Validate an (N, 5) array of actuator states, returns a boolean mask of the states within the limits"""
+        act_states = np.asarray(act_states, dtype=float).reshape(-1, 5)
+        d_1, theta_1, theta_2, theta_3, l_6 = act_states.T
+
+        return ((abs(self.__dimensions.d_4) <= d_1) & (d_1 <= self.__dimensions.l_1)
+                & (self.__min_angle <= theta_1) & (theta_1 <= self.__max_angle)
+                & (self.__min_theta_2 <= theta_2) & (theta_2 <= self.__max_theta_2)
+                & (self.__min_angle <= theta_3) & (theta_3 <= self.__max_angle)
+                & (-self.__dimensions.l_7 <= l_6) & (l_6 <= self.__dimensions.l_7))
+
+    def wrap_into_limits(self, angles: np.ndarray) -> np.ndarray:
+        """
+        Wrap swing or wrist angles beyond their limits to [-180, 180) degrees, the same orientation within the limits
+        Swing and wrist have a full turn in both directions, so angles within the limits are kept as they are
+        """
+        return np.where((angles < self.__min_angle) | (angles > self.__max_angle), wrap_angles(angles), angles)
+
+    def validate_velocities_accelerations_batch(self, velocities: np.ndarray, accelerations: np.ndarray) -> np.ndarray:
+        """
+        Validate (N, 5) arrays of actuator velocities and accelerations, returns a boolean mask of the states within
+        the max velocities and accelerations, up to a relative tolerance for planning in floating point
+        """
+        max_velocities = np.array([self.max_vel, self.max_ang_vel, self.max_ang_vel, self.max_ang_vel, self.max_vel])
+        max_accelerations = np.array([self.max_acc, self.max_ang_acc, self.max_ang_acc, self.max_ang_acc, self.max_acc])
+
+        return (np.all(np.abs(velocities) <= max_velocities * (1 + LIMIT_TOLERANCE), axis=-1)
+                & np.all(np.abs(accelerations) <= max_accelerations * (1 + LIMIT_TOLERANCE), axis=-1))
+
     def get_dimensions(self) -> Dimensions:
         return self.__dimensions
 
@@ -95,13 +136,35 @@ class RobotCrane(object):
         return self.origin_t_1[
             3] + self.act_states_t_1.theta_1 + self.act_states_t_1.theta_2 + self.act_states_t_1.theta_3
 
+    def get_end_effector_pose(self) -> Tuple[float, float, float, float]:
+        """Get the x, y, z position and the rotation of the robot end effector from a single evaluation"""
+        end_effector = self.get_frames()[-1]
+        return end_effector[0][3].item(), end_effector[1][3].item(), end_effector[2][3].item(), self.get_phi()
+
     def get_frames(self) -> np.ndarray:
-        """Get the robot state frames"""
-        return np.around(calculate_state_frames(len(self.denavit_hartenberg_parameters), self.transformation_matrices),
-                         5)
+        """Get the robot state frames, the frames are only recalculated when the origin or actuator states change"""
+        frames_key = (self.origin_t_1, self.act_states_t_1.get_states())
+        if self.__frames_key != frames_key:
+            start = perf_counter()
+            self.__frames = np.around(
+                calculate_state_frames(len(self.denavit_hartenberg_parameters), self.transformation_matrices), 5)
+            self.__frames_key = frames_key
+            FORWARD_KINEMATICS_SECONDS.observe(perf_counter() - start)
+
+        return self.__frames
+
+    def get_frames_batch(self, act_states: np.ndarray, origins: np.ndarray) -> np.ndarray:
+        """Get the robot state frames for an (N, 5) array of actuator states and an (N, 4) array of origins"""
+        start = perf_counter()
+        frames = np.around(calculate_state_frames_batch(self.__dimensions.l_2, self.__dimensions.l_3,
+                                                        self.__dimensions.d_4, self.__dimensions.l_5,
+                                                        act_states, origins), 5)
+        FORWARD_KINEMATICS_SECONDS.observe_batch(perf_counter() - start, len(frames))
+        return frames
 
     def inverse_kinematics(self, x: float, y: float, z: float, phi: float, do_open_gripper=True) -> ActuatorStates:
         """Robot inverse kinematics, including origin translation"""
+        start = perf_counter()
 
         phi, x, y, z = translate_desired_end_effector_state_for_new_origin(self.origin_translation_matrix,
                                                                            self.origin_t_1, phi, x, y, z)
@@ -109,8 +172,34 @@ class RobotCrane(object):
         d_1, theta_1, theta_2, theta_3, l_6 = calculate_inverse_kinematics(
             self.__dimensions.l_2, self.__dimensions.l_3, self.__dimensions.d_4, self.__dimensions.l_5,
             do_open_gripper, phi, x, y, z)
+        theta_1, theta_3 = self.wrap_into_limits(np.array([theta_1, theta_3])).tolist()
 
+        INVERSE_KINEMATICS_SECONDS.observe(perf_counter() - start)
         return ActuatorStates(d_1, theta_1, theta_2, theta_3, l_6)
 
+    def inverse_kinematics_batch(self, targets: np.ndarray, origins: np.ndarray = None, do_open_gripper=True,
+                                 elbow_up=True, validate=True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Robot inverse kinematics for an (N, 4) array of (x, y, z, phi) targets, including origin translation
+        Uses the current origin when no (N, 4) array of origins is given
+        Returns an (N, 5) array of actuator states and a boolean mask of the targets that are reachable and, unless
+        validate is disabled, within the actuator limits. Validated swing and wrist angles are wrapped into their limits
+        like inverse_kinematics does, unvalidated angles are left for the caller to make continuous
+        """
+        if origins is None:
+            origins = self.origin_t_1
+
+        targets = translate_desired_end_effector_states_for_new_origins(origins, targets)
+
+        act_states, reachable = calculate_inverse_kinematics_batch(
+            self.__dimensions.l_2, self.__dimensions.l_3, self.__dimensions.d_4, self.__dimensions.l_5,
+            do_open_gripper, targets[:, 3], targets[:, 0], targets[:, 1], targets[:, 2], elbow_up)
+
+        if not validate:
+            return act_states, reachable
+
+        act_states[:, [1, 3]] = self.wrap_into_limits(act_states[:, [1, 3]])
+        return act_states, reachable & self.validate_act_states_batch(act_states)
+
     def reset_velocity_and_acceleration(self) -> None:
         self.act_states_t_1.reset_vel_and_acc()
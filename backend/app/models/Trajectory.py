@@ -1,4 +1,4 @@
-from backend.app.models.ActuatorStates import ActuatorStates
+from backend.app.models.ActuatorStates import ActuatorStates, from_array
 from backend.app.models.RobotCrane import RobotCrane
 from backend.app.services.tools.TrajectoryHelper import *
 
@@ -7,7 +7,7 @@ class Trajectory(object):
     """Defining a trajectory for the robot"""
 
     def __init__(self, act_states_t_0: ActuatorStates, act_states_t_1: ActuatorStates, max_vel: float, max_acc: float,
-                 max_ang_vel: float, max_ang_acc: float):
+                 max_ang_vel: float, max_ang_acc: float, max_iterations: int = 50):
         self.act_states_t_0 = act_states_t_0
         self.act_states_t_1 = act_states_t_1
 
@@ -15,11 +15,46 @@ class Trajectory(object):
         self.max_acc = max_acc
         self.max_ang_vel = max_ang_vel
         self.max_ang_acc = max_ang_acc
+        self.max_iterations = max_iterations
 
         self.__moving_time = self.min_move_time
+        self.__coefficients = self.calculate_coefficients()
 
     @property
     def min_move_time(self) -> float:
+        """
+        Minimum moving time within the max velocity and acceleration of the actuators
+        A motion that continues a preempted motion starts with its velocity, its moving time is then stretched from the
+        moving time at rest until the velocities and accelerations are within limits
+        """
+        t_min = self.min_move_time_at_rest
+        velocities = np.asarray(self.act_states_t_0.get_velocities())
+        if not velocities.any():
+            return t_min
+
+        # Limits per joint, ordered as the actuator states
+        max_velocities = np.array([self.max_vel, self.max_ang_vel, self.max_ang_vel, self.max_ang_vel, self.max_vel])
+        max_accelerations = np.array([self.max_acc, self.max_ang_acc, self.max_ang_acc, self.max_ang_acc, self.max_acc])
+
+        # Stopping takes at least as long as braking at max acceleration
+        t_min = max(t_min, (np.abs(velocities) / max_accelerations).max().item())
+
+        for _ in range(self.max_iterations):
+            coefficients = get_coefficients_array(self.act_states_t_0.get_states(), self.act_states_t_1.get_states(),
+                                                  velocities, t_min)
+            peak_velocities, peak_accelerations = calculate_peak_velocities_accelerations(coefficients[np.newaxis],
+                                                                                          np.array([t_min]))
+            scale = np.maximum(peak_velocities / max_velocities, np.sqrt(peak_accelerations / max_accelerations)).max()
+
+            if scale <= 1 + 1e-6:
+                break
+
+            t_min *= scale.item()
+
+        return t_min
+
+    @property
+    def min_move_time_at_rest(self) -> float:
         t_min_d_1 = calculate_minimum_move_time(self.max_vel, self.max_acc, self.act_states_t_0.d_1,
                                                 self.act_states_t_1.d_1)
         t_min_theta_1 = calculate_minimum_move_time(self.max_ang_vel, self.max_ang_acc, self.act_states_t_0.theta_1,
@@ -33,33 +68,38 @@ class Trajectory(object):
 
         return max(t_min_d_1, t_min_theta_1, t_min_theta_2, t_min_theta_3, t_min_l_6)
 
+    @property
+    def coefficients(self) -> np.ndarray:
+        """Trajectory formula coefficients as a (joints, 4) array, ordered as the actuator states"""
+        return self.__coefficients
+
     @property
     def d_1_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.act_states_t_0.d_1, self.act_states_t_1.d_1,
-                                                self.act_states_t_0.d_1_v, self.__moving_time)
+        return tuple(self.__coefficients[0])
 
     @property
     def theta_1_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.act_states_t_0.theta_1, self.act_states_t_1.theta_1,
-                                                self.act_states_t_0.theta_1_v, self.__moving_time)
+        return tuple(self.__coefficients[1])
 
     @property
     def theta_2_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.act_states_t_0.theta_2, self.act_states_t_1.theta_2,
-                                                self.act_states_t_0.theta_2_v, self.__moving_time)
+        return tuple(self.__coefficients[2])
 
     @property
     def theta_3_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.act_states_t_0.theta_3, self.act_states_t_1.theta_3,
-                                                self.act_states_t_0.theta_3_v, self.__moving_time)
+        return tuple(self.__coefficients[3])
 
     @property
     def l_6_coefficients(self) -> Tuple[float, float, float, float]:
-        return get_coefficients_nonzero_v_and_a(self.act_states_t_0.l_6, self.act_states_t_1.l_6,
-                                                self.act_states_t_0.l_6_v, self.__moving_time)
+        return tuple(self.__coefficients[4])
+
+    def calculate_coefficients(self) -> np.ndarray:
+        return get_coefficients_array(self.act_states_t_0.get_states(), self.act_states_t_1.get_states(),
+                                      self.act_states_t_0.get_velocities(), self.__moving_time)
 
     def set_moving_time(self, time: float) -> None:
         self.__moving_time = time
+        self.__coefficients = self.calculate_coefficients()
 
     def get_moving_time(self) -> float:
         return self.__moving_time
@@ -71,13 +111,10 @@ class Trajectory(object):
         return self.calculate_next_step(t)
 
     def calculate_next_step(self, t: float) -> ActuatorStates:
-        d_1, d_1_v, d_1_a = calculate_position_velocity_acceleration(*self.d_1_coefficients, t)
-        t_1, t_1_v, t_1_a = calculate_position_velocity_acceleration(*self.theta_1_coefficients, t)
-        t_2, t_2_v, t_2_a = calculate_position_velocity_acceleration(*self.theta_2_coefficients, t)
-        t_3, t_3_v, t_3_a = calculate_position_velocity_acceleration(*self.theta_3_coefficients, t)
-        l_6, l_6_v, l_6_a = calculate_position_velocity_acceleration(*self.l_6_coefficients, t)
-
-        return ActuatorStates(
-            d_1, t_1, t_2, t_3, l_6,
-            d_1_v, t_1_v, t_2_v, t_3_v, l_6_v,
-            d_1_a, t_1_a, t_2_a, t_3_a, l_6_a)
+        positions, velocities, accelerations = self.sample(np.array([t]))
+
+        return from_array(np.concatenate((positions[0], velocities[0], accelerations[0])))
+
+    def sample(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sample position, velocity and acceleration of all joints at all times, each as a (times, joints) array"""
+        return calculate_positions_velocities_accelerations(self.__coefficients, times)
@@ -1,32 +1,39 @@
-from backend.app.models.ActuatorStates import ActuatorStates
+import numpy as np
+
+from backend.app.models.ActuatorStates import ActuatorStates, from_array, STATE_COUNT, POSITIONS
 from backend.app.models.RobotCrane import RobotCrane
 from backend.app.services.SimpleController import SimpleController
 
+# Controller gains (kp, ki, kd) per actuator
+DEFAULT_GAINS = {
+    "d1": (1, 0, 0.017),
+    "t1": (0.5, 0.5, 0.013),
+    "t2": (0.5, 0.5, 0.013),
+    "t3": (0.5, 0.5, 0.013),
+}
+
 
 class ControlSimulator(object):
     """Simulating the origin sensor signal and the control loop"""
 
-    def __init__(self, moving_time: float, robot: RobotCrane):
+    def __init__(self, moving_time: float, robot: RobotCrane, gains: dict = None):
         self.origin_sensor_frequency = 40
         self.control_frequency = 30
 
         self.moving_time = moving_time
 
-        kp, ki, kd = 0.5, 0.5, 0.013
-        self.d1_controller = SimpleController(kp=1, ki=0, kd=0.017, control_frequency=self.control_frequency,
+        gains = DEFAULT_GAINS | (gains or {})
+        self.d1_controller = SimpleController(*gains["d1"], control_frequency=self.control_frequency,
                                               max_velocity=robot.max_vel)
-        self.t1_controller = SimpleController(kp=kp, ki=ki, kd=kd, control_frequency=self.control_frequency,
+        self.t1_controller = SimpleController(*gains["t1"], control_frequency=self.control_frequency,
                                               max_velocity=robot.max_ang_vel)
-        self.t2_controller = SimpleController(kp=kp, ki=ki, kd=kd, control_frequency=self.control_frequency,
+        self.t2_controller = SimpleController(*gains["t2"], control_frequency=self.control_frequency,
                                               max_velocity=robot.max_ang_vel)
-        self.t3_controller = SimpleController(kp=kp, ki=ki, kd=kd, control_frequency=self.control_frequency,
+        self.t3_controller = SimpleController(*gains["t3"], control_frequency=self.control_frequency,
                                               max_velocity=robot.max_ang_vel)
 
         # Initialize target end-effector position with the current robot end-effector position
-        self.target_x = robot.get_x_position()
-        self.target_y = robot.get_y_position()
-        self.target_z = robot.get_z_position()
-        self.target_phi = robot.get_phi()
+        self.target_x, self.target_y, self.target_z, self.target_phi = robot.get_end_effector_pose()
 
         # Set initial target for controllers
         desired_act_state = robot.inverse_kinematics(self.target_x, self.target_y, self.target_z, self.target_phi)
@@ -40,6 +47,7 @@ class ControlSimulator(object):
         self.actual_x_positions, self.actual_y_positions, self.actual_z_positions = [], [], []
         self.target_x_positions, self.target_y_positions, self.target_z_positions = [], [], []
         self.d1_control_signals, self.t1_control_signals, self.t2_control_signals, self.t3_control_signals = [], [], [], []
+        self.d1_errors, self.t1_errors, self.t2_errors, self.t3_errors = [], [], [], []
 
     def next_step(self, robot: RobotCrane, t: float, next_origin: tuple) -> None | RobotCrane:
         if t > self.moving_time:
@@ -72,11 +80,11 @@ class ControlSimulator(object):
         return robot
 
     def calculate_new_actuator_states(self, robot: RobotCrane) -> ActuatorStates:
-        return ActuatorStates(robot.act_states_t_1.d_1 + self.d1_controller.signal,
-                              robot.act_states_t_1.theta_1 + self.t1_controller.signal,
-                              robot.act_states_t_1.theta_2 + self.t2_controller.signal,
-                              robot.act_states_t_1.theta_3 + self.t3_controller.signal,
-                              robot.act_states_t_1.l_6)
+        states = np.zeros(STATE_COUNT)
+        states[POSITIONS] = robot.act_states_t_1.positions
+        states[0:4] += (self.d1_controller.signal, self.t1_controller.signal, self.t2_controller.signal,
+                        self.t3_controller.signal)
+        return from_array(states)
 
     def calculate_control_signal(self, robot: RobotCrane) -> None:
         self.d1_controller.calculate_signal(robot.act_states_t_1.d_1)
@@ -96,19 +104,43 @@ class ControlSimulator(object):
     def should_simulate_origin_signal(self, t: float) -> bool:
         return t - self.time_of_last_sensor_signal >= (1 / self.origin_sensor_frequency)
 
+    def get_control_metrics(self, robot: RobotCrane) -> tuple:
+        """Get the actual and target end-effector pose, the control signals and the actuator errors"""
+        actual = robot.get_end_effector_pose()
+        target = (self.target_x, self.target_y, self.target_z, self.target_phi)
+
+        signals = (self.d1_controller.signal, self.t1_controller.signal, self.t2_controller.signal,
+                   self.t3_controller.signal)
+
+        # Actuator errors with respect to the controller targets
+        errors = (self.d1_controller.target - robot.act_states_t_1.d_1,
+                  self.t1_controller.target - robot.act_states_t_1.theta_1,
+                  self.t2_controller.target - robot.act_states_t_1.theta_2,
+                  self.t3_controller.target - robot.act_states_t_1.theta_3)
+
+        return actual, target, signals, errors
+
     def save_metrics_for_plotting(self, robot: RobotCrane) -> None:
+        actual, target, signals, errors = self.get_control_metrics(robot)
+
         # Save desired end-effector position
-        self.target_x_positions.append(self.target_x)
-        self.target_y_positions.append(self.target_y)
-        self.target_z_positions.append(self.target_z)
+        self.target_x_positions.append(target[0])
+        self.target_y_positions.append(target[1])
+        self.target_z_positions.append(target[2])
 
         # Save actual end-effector position
-        self.actual_x_positions.append(robot.get_x_position())
-        self.actual_y_positions.append(robot.get_y_position())
-        self.actual_z_positions.append(robot.get_z_position())
+        self.actual_x_positions.append(actual[0])
+        self.actual_y_positions.append(actual[1])
+        self.actual_z_positions.append(actual[2])
 
         # Save control signals
-        self.d1_control_signals.append(self.d1_controller.signal)
-        self.t1_control_signals.append(self.t1_controller.signal)
-        self.t2_control_signals.append(self.t2_controller.signal)
-        self.t3_control_signals.append(self.t3_controller.signal)
+        self.d1_control_signals.append(signals[0])
+        self.t1_control_signals.append(signals[1])
+        self.t2_control_signals.append(signals[2])
+        self.t3_control_signals.append(signals[3])
+
+        # Save actuator errors with respect to the controller targets
+        self.d1_errors.append(errors[0])
+        self.t1_errors.append(errors[1])
+        self.t2_errors.append(errors[2])
+        self.t3_errors.append(errors[3])
@@ -0,0 +1,193 @@
+import numpy as np
+
+from backend.app.models.ActuatorStates import ActuatorStates, from_array, STATE_COUNT, POSITIONS, VELOCITIES
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.ControlSimulator import DEFAULT_GAINS
+from backend.app.services.tools.TrajectoryHelper import calculate_minimum_move_times, get_coefficients_array, \
+    calculate_position, calculate_velocity
+
+
+class FleetSimulator(object):
+    """
+    Simulating a fleet of identical robot cranes as a structure of arrays
+    Every robot follows an actuator trajectory and an origin trajectory, or compensates its origin trajectory
+    with the PID controllers of the ControlSimulator. All robots are advanced in one vectorized step
+    """
+
+    def __init__(self, size: int, robot: RobotCrane = None, gains: dict = None):
+        # Template for the dimensions, limits and initial state of all robots
+        self.robot = robot if robot is not None else RobotCrane()
+        self.size = size
+
+        # Origin limits, as the OriginTrajectory defaults
+        self.origin_max_vel, self.origin_max_acc = 0.1, 0.1
+        self.origin_max_ang_vel, self.origin_max_ang_acc = 0.1, 0.1
+
+        self.origin_sensor_frequency = 40
+        self.control_frequency = 30
+        self.time = 0.0
+        self.time_of_last_sensor_signal = 0.0
+        self.time_of_last_control_signal = 0.0
+
+        # Actuator states laid out as in ActuatorStates (robots, 15), with position and velocity views (robots, 5)
+        self.states = np.zeros((size, STATE_COUNT))
+        self.states[:, POSITIONS] = self.robot.act_states_t_1.positions
+        self.positions = self.states[:, POSITIONS]
+        self.velocities = self.states[:, VELOCITIES]
+
+        # Origins (robots, 4)
+        self.origins = np.tile(np.asarray(self.robot.origin_t_1, dtype=float), (size, 1))
+
+        # Trajectories as coefficients, start times and moving times per robot
+        self.act_coefficients = get_coefficients_array(self.positions, self.positions, self.velocities, 0.0)
+        self.act_start_times = np.zeros((size, 1))
+        self.act_moving_times = np.zeros((size, 1))
+        self.origin_coefficients = get_coefficients_array(self.origins, self.origins, np.zeros((size, 4)), 0.0)
+        self.origin_start_times = np.zeros((size, 1))
+        self.origin_moving_times = np.zeros((size, 1))
+
+        # Controllers of d1, theta 1, theta 2 and theta 3, (robots, 4)
+        gains = DEFAULT_GAINS | (gains or {})
+        self.kp, self.ki, self.kd = np.array([gains[joint] for joint in ("d1", "t1", "t2", "t3")]).T
+        self.max_signal = np.array([self.robot.max_vel, self.robot.max_ang_vel, self.robot.max_ang_vel,
+                                    self.robot.max_ang_vel]) / self.control_frequency
+        self.controlled = np.zeros(size, dtype=bool)
+        self.end_effector_targets = np.zeros((size, 4))
+        self.control_targets = self.positions[:, 0:4].copy()
+        self.error_sums = np.zeros((size, 4))
+        self.last_readings = np.full((size, 4), np.nan)
+        self.signals = np.zeros((size, 4))
+
+        # Robots that left their actuator limits are stopped
+        self.faulted = np.zeros(size, dtype=bool)
+
+        self.frames = self.robot.get_frames_batch(self.positions, self.origins)
+
+    def set_actuator_targets(self, indices: np.ndarray, targets: np.ndarray) -> None:
+        """Move the actuators of the selected robots to (robots, 5) targets, from their current state"""
+        targets = np.asarray(targets, dtype=float).reshape(-1, 5)
+        start = self.positions[indices]
+
+        moving_times = np.maximum(
+            calculate_minimum_move_times(self.robot.max_vel, self.robot.max_acc, start[:, [0, 4]], targets[:, [0, 4]]),
+            calculate_minimum_move_times(self.robot.max_ang_vel, self.robot.max_ang_acc, start[:, 1:4],
+                                         targets[:, 1:4]).max(axis=1, keepdims=True)).max(axis=1, keepdims=True)
+
+        self.set_actuator_trajectories(indices, start, targets, self.velocities[indices], moving_times)
+        self.controlled[indices] = False
+
+    def set_origin_targets(self, indices: np.ndarray, targets: np.ndarray, control_end_effector: bool = False) -> None:
+        """
+        Move the origins of the selected robots to (robots, 4) targets
+        The actuators either hold their positions, or are controlled to keep the end effector at its current pose
+        """
+        targets = np.asarray(targets, dtype=float).reshape(-1, 4)
+        start = self.origins[indices]
+
+        moving_times = np.maximum(
+            calculate_minimum_move_times(self.origin_max_vel, self.origin_max_acc, start[:, 0:3],
+                                         targets[:, 0:3]).max(axis=1, keepdims=True),
+            calculate_minimum_move_times(self.origin_max_ang_vel, self.origin_max_ang_acc, start[:, 3:4],
+                                         targets[:, 3:4]))
+
+        self.origin_coefficients[indices] = get_coefficients_array(start, targets, np.zeros(start.shape), moving_times)
+        self.origin_start_times[indices] = self.time
+        self.origin_moving_times[indices] = moving_times
+
+        positions = self.positions[indices]
+        self.set_actuator_trajectories(indices, positions, positions, np.zeros(positions.shape), moving_times)
+
+        self.controlled[indices] = control_end_effector
+        if control_end_effector:
+            self.end_effector_targets[indices] = self.get_end_effector_poses()[indices]
+            self.control_targets[indices] = positions[:, 0:4]
+            self.error_sums[indices] = 0
+            self.last_readings[indices] = np.nan
+
+    def set_actuator_trajectories(self, indices: np.ndarray, start: np.ndarray, targets: np.ndarray,
+                                  velocities: np.ndarray, moving_times: np.ndarray) -> None:
+        self.act_coefficients[indices] = get_coefficients_array(start, targets, velocities, moving_times)
+        self.act_start_times[indices] = self.time
+        self.act_moving_times[indices] = moving_times
+
+    def step(self, time_step: float) -> None:
+        """Advance the trajectories, controllers and forward kinematics of all robots"""
+        self.time += time_step
+
+        # Sample the trajectories at the elapsed time of each robot
+        act_t = np.clip(self.time - self.act_start_times, 0, self.act_moving_times)
+        a_0, a_1, a_2, a_3 = np.moveaxis(self.act_coefficients, -1, 0)
+        positions = calculate_position(a_0, a_1, a_2, a_3, act_t)
+        velocities = np.where(act_t < self.act_moving_times, calculate_velocity(a_1, a_2, a_3, act_t), 0.0)
+
+        origin_t = np.clip(self.time - self.origin_start_times, 0, self.origin_moving_times)
+        o_0, o_1, o_2, o_3 = np.moveaxis(self.origin_coefficients, -1, 0)
+        origins = calculate_position(o_0, o_1, o_2, o_3, origin_t)
+
+        if self.controlled.any():
+            positions, velocities, origins = self.control(positions, velocities, origins)
+
+        # Robots that faulted in their controller, when their target is out of reach, do not move either
+        active = ~self.faulted
+
+        # Only robots within the actuator limits move
+        within_limits = self.robot.validate_act_states_batch(positions)
+        self.faulted |= active & ~within_limits
+        moving = active & within_limits
+
+        self.positions[moving] = positions[moving]
+        self.velocities[moving] = velocities[moving]
+        self.origins[moving] = origins[moving]
+        self.velocities[~moving] = 0
+
+        self.frames = self.robot.get_frames_batch(self.positions, self.origins)
+
+    def control(self, positions: np.ndarray, velocities: np.ndarray, origins: np.ndarray) -> tuple:
+        """Simulate the origin sensor and controllers of the controlled robots, as the ControlSimulator does"""
+        controlled = self.controlled
+
+        # The origin of controlled robots is only updated by the origin sensor
+        if self.time - self.time_of_last_sensor_signal >= 1 / self.origin_sensor_frequency:
+            self.time_of_last_sensor_signal = self.time
+
+            desired, reachable = self.robot.inverse_kinematics_batch(self.end_effector_targets[controlled],
+                                                                     origins[controlled])
+            indices = np.flatnonzero(controlled)
+            self.faulted[indices[~reachable]] = True
+            self.control_targets[indices[reachable]] = desired[reachable, 0:4]
+            self.error_sums[indices[reachable]] = 0
+        else:
+            origins[controlled] = self.origins[controlled]
+
+        if self.time - self.time_of_last_control_signal >= 1 / self.control_frequency:
+            self.time_of_last_control_signal = self.time
+            self.calculate_control_signals(controlled)
+
+        positions[controlled] = self.positions[controlled]
+        positions[controlled, 0:4] += self.signals[controlled]
+        velocities[controlled] = 0
+
+        return positions, velocities, origins
+
+    def calculate_control_signals(self, controlled: np.ndarray) -> None:
+        actual = self.positions[controlled, 0:4]
+        last_readings = np.where(np.isnan(self.last_readings[controlled]), actual, self.last_readings[controlled])
+
+        errors = self.control_targets[controlled] - actual
+        self.error_sums[controlled] += errors
+
+        signals = (self.kp * errors + self.ki * self.error_sums[controlled]
+                   + self.kd * (actual - last_readings) * self.control_frequency)
+
+        # Cap signal based on max velocity
+        self.signals[controlled] = np.clip(signals, -self.max_signal, self.max_signal)
+        self.last_readings[controlled] = actual
+
+    def get_actuator_states(self, index: int) -> ActuatorStates:
+        """Get the actuator states of a robot, sharing memory with the fleet states"""
+        return from_array(self.states[index])
+
+    def get_end_effector_poses(self) -> np.ndarray:
+        """Get the (robots, 4) x, y, z and phi of the end effectors"""
+        phi = self.origins[:, 3] + self.positions[:, 1] + self.positions[:, 2] + self.positions[:, 3]
+        return np.concatenate((self.frames[:, -1, 0:3, 3], phi[:, np.newaxis]), axis=1)
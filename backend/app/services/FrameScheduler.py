@@ -0,0 +1,76 @@
+import asyncio
+from time import monotonic
+
+from backend.app.services.Metrics import MISSED_FRAME_DEADLINES
+
+# Frames are sampled at multiples of the frame period in floating point, e.g. 3 * 0.02 is slightly more than 0.06,
+# while elapsed times come from whole milliseconds. Looking up a frame by elapsed time allows for this tolerance,
+# so an elapsed time of 60 ms reaches the frame sampled at 0.06
+TIME_TOLERANCE = 1e-6
+
+
+def get_current_time_ms() -> int:
+    """Return the current time of the monotonic clock in milliseconds."""
+    return round(monotonic() * 1000)
+
+
+class FrameScheduler(object):
+    """
+    Schedule frames on fixed deadlines at the given frequency
+    Sleeps until the next deadline instead of busy-waiting, deadlines are derived from the start time
+    so sleeping inaccuracies do not accumulate, and deadlines that have passed are skipped and counted as missed
+    A sleep that wakes up before the deadline sleeps again, so a frame is never handled early
+    The frequency can change while running, deadlines are then derived from the next deadline at the old frequency
+    """
+
+    def __init__(self, frequency: float):
+        self.frequency = frequency
+        self.start_time_ms = 0
+        self.next_deadline_ms = 0
+        self.frame_count = 0
+        self.missed_deadlines = 0
+
+        # Deadline and frame count from which deadlines are derived at the current frequency
+        self.__anchor_ms = 0
+        self.__anchor_frame_count = 0
+
+    @property
+    def frame_period_ms(self) -> float:
+        return 1000 / self.frequency
+
+    def start(self) -> None:
+        self.start_time_ms = get_current_time_ms()
+        self.next_deadline_ms = self.start_time_ms
+        self.frame_count = 0
+        self.missed_deadlines = 0
+        self.__anchor_ms = self.start_time_ms
+        self.__anchor_frame_count = 0
+
+    def set_frequency(self, frequency: float) -> None:
+        """Change the frequency from the next deadline on, the elapsed time stays continuous"""
+        self.frequency = frequency
+        self.__anchor_ms = self.next_deadline_ms
+        self.__anchor_frame_count = self.frame_count
+
+    async def wait_for_next_frame(self) -> int:
+        """Sleep until the next frame deadline and return the current time in milliseconds"""
+        # Event loops with millisecond timers, such as uvloop, can wake up just before the deadline
+        current_time_ms = get_current_time_ms()
+        while current_time_ms < self.next_deadline_ms:
+            await asyncio.sleep((self.next_deadline_ms - current_time_ms) / 1000)
+            current_time_ms = get_current_time_ms()
+
+        # Skip the deadlines that passed while the previous frame was being handled
+        lag_ms = current_time_ms - self.next_deadline_ms
+        missed = int(lag_ms // self.frame_period_ms) if lag_ms > 0 else 0
+        self.missed_deadlines += missed
+        if missed:
+            MISSED_FRAME_DEADLINES.inc(missed)
+
+        self.frame_count += missed + 1
+        self.next_deadline_ms = self.__anchor_ms + (self.frame_count - self.__anchor_frame_count) * self.frame_period_ms
+
+        return current_time_ms
+
+    def get_elapsed_time_in_seconds(self, current_time_ms: int) -> float:
+        return (current_time_ms - self.start_time_ms) / 1000
@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+
+from backend.app.models.ActuatorStates import ActuatorStates
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.HeadlessSimulator import HeadlessSimulator
+from backend.app.services.tools.ControlHelper import CONTROL_TIME_STEP
+
+JOINTS = ("d1", "t1", "t2", "t3")
+
+
+def create_gain_grid(kp_values: list, ki_values: list, kd_values: list) -> list[tuple]:
+    """Create all combinations of the given kp, ki and kd values"""
+    return list(product(kp_values, ki_values, kd_values))
+
+
+def calculate_tracking_error(times: np.ndarray, errors: np.ndarray) -> float:
+    """Mean absolute error over the move"""
+    if len(times) < 2:
+        return 0.0
+    return (np.trapz(np.abs(errors), times) / (times[-1] - times[0])).item()
+
+
+def calculate_overshoot(errors: np.ndarray) -> float:
+    """Largest error past the target, opposite to the direction of the dominant error"""
+    if len(errors) == 0:
+        return 0.0
+    direction = np.sign(errors[np.argmax(np.abs(errors))])
+    return max(0.0, (-direction * errors).max().item())
+
+
+def calculate_settle_time(times: np.ndarray, errors: np.ndarray, tolerance: float) -> float:
+    """Time after which the error stays within the tolerance"""
+    outside = np.flatnonzero(np.abs(errors) > tolerance)
+    if len(outside) == 0:
+        return 0.0
+    if outside[-1] == len(errors) - 1:
+        return times[-1].item()
+    return times[outside[-1] + 1].item()
+
+
+def score_errors(times: np.ndarray, errors: np.ndarray, weights: tuple, tolerance: float) -> float:
+    tracking_error = calculate_tracking_error(times, errors)
+    overshoot = calculate_overshoot(errors)
+    settle_time = calculate_settle_time(times, errors, tolerance)
+
+    return weights[0] * tracking_error + weights[1] * overshoot + weights[2] * settle_time
+
+
+def evaluate_scenario(gains: tuple, scenario: tuple, weights: tuple, tolerance: float) -> dict[str, float]:
+    """
+    Simulate an origin move with the same gains on every joint and score each joint
+    The controllers only see their own actuator, so each joint score only depends on the gains of that joint
+    """
+    positions, new_origin = scenario
+    robot = RobotCrane()
+    robot.set_act_states_t_1(ActuatorStates(*positions))
+    robot.set_act_states_t_0(robot.act_states_t_1)
+
+    # Tuned at the control step of the server, the ranking does not carry over to other steps
+    simulator = HeadlessSimulator(time_step=CONTROL_TIME_STEP, gains={joint: gains for joint in JOINTS})
+    try:
+        metrics = simulator.run(robot, new_origin)
+    except ValueError:
+        # The gains drove an actuator out of its limits
+        return {joint: np.inf for joint in JOINTS}
+
+    return {joint: score_errors(metrics["time"], metrics[f"{joint}_errors"], weights, tolerance)
+            for joint in JOINTS}
+
+
+class GainTuner(object):
+    """
+    Searching PID gains for the ControlSimulator controllers
+    A scenario is the initial actuator positions of the robot and the origin it moves to. Every candidate is
+    simulated for every scenario in a process pool, and scored per joint by weighted tracking error, overshoot
+    and settle time, lower is better
+    """
+
+    def __init__(self, scenarios: list[tuple], weights: tuple = (1.0, 1.0, 0.01), tolerance: float = 1e-3,
+                 max_workers: int = None):
+        self.scenarios = scenarios
+        self.weights = weights
+        self.tolerance = tolerance
+        self.max_workers = max_workers
+
+    def search(self, candidates: list[tuple]) -> list[dict]:
+        """Score all candidate (kp, ki, kd) gains, returns the ranking table sorted by total score"""
+        tasks = [(gains, scenario) for gains in candidates for scenario in self.scenarios]
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(evaluate_scenario, gains, scenario, self.weights, self.tolerance)
+                       for gains, scenario in tasks]
+            scores = [future.result() for future in futures]
+
+        table = []
+        for index, gains in enumerate(candidates):
+            scenario_scores = scores[index * len(self.scenarios):(index + 1) * len(self.scenarios)]
+            row = {"gains": gains}
+            for joint in JOINTS:
+                row[joint] = sum(score[joint] for score in scenario_scores)
+            row["total"] = sum(row[joint] for joint in JOINTS)
+            table.append(row)
+
+        return sorted(table, key=lambda row: row["total"])
+
+
+def get_best_gains(table: list[dict]) -> dict[str, tuple]:
+    """Get the best gains per joint from a ranking table"""
+    return {joint: min(table, key=lambda row: row[joint])["gains"] for joint in JOINTS}
+
+
+def format_ranking_table(table: list[dict]) -> str:
+    lines = [f"{'rank':>4} {'kp':>8} {'ki':>8} {'kd':>8} " + " ".join(f"{joint:>10}" for joint in JOINTS)
+             + f" {'total':>10}"]
+    for rank, row in enumerate(table, start=1):
+        kp, ki, kd = row["gains"]
+        lines.append(f"{rank:>4} {kp:>8.4g} {ki:>8.4g} {kd:>8.4g} "
+                     + " ".join(f"{row[joint]:>10.4g}" for joint in JOINTS) + f" {row['total']:>10.4g}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    start = (0.7, 0.0, np.deg2rad(90), 0.0, 0.1)
+    tuner = GainTuner([(start, (0.2, 0.0, 0.0, 0.0)), (start, (0.0, 0.2, 0.0, 0.0)), (start, (0.0, 0.0, 0.2, 0.0)),
+                       (start, (0.1, 0.1, 0.0, 0.3))])
+    ranking = tuner.search(create_gain_grid([0.25, 0.5, 1.0], [0.0, 0.25, 0.5], [0.0, 0.013, 0.05]))
+
+    print(format_ranking_table(ranking))
+    print(f"Best gains per joint: {get_best_gains(ranking)}")
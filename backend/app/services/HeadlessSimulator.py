@@ -0,0 +1,80 @@
+import numpy as np
+
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.ControlSimulator import ControlSimulator
+from backend.app.services.MotionRecorder import MotionRecorder
+from backend.app.services.tools.ControlHelper import plan_origin_control, \
+    update_robot_with_new_origin_and_control_end_effector, CONTROL_TIME_STEP
+
+
+class HeadlessSimulator(object):
+    """
+    Simulating an origin move with end-effector control on a virtual clock, faster than real time
+    The clock advances by the time step, the control step of the server by default so the dynamics match those
+    streamed to clients. Without a time step it advances to the next origin sensor signal or control signal of the
+    ControlSimulator instead. Controller gains default to those of the ControlSimulator
+    Every simulated step is optionally recorded
+    """
+
+    def __init__(self, time_step: float | None = CONTROL_TIME_STEP, gains: dict = None,
+                 recorder: MotionRecorder = None):
+        self.time_step = time_step
+        self.gains = gains
+        self.recorder = recorder
+
+    def run(self, robot: RobotCrane, new_origin: tuple) -> dict[str, np.ndarray]:
+        """Move the robot to the new origin and return the recorded metrics as arrays"""
+        robot.set_origin_t_1(new_origin)
+        origin_trajectory, simulator = plan_origin_control(robot, self.gains)
+
+        if self.recorder is not None:
+            self.recorder.start_motion("simulation")
+
+        times = []
+        t = 0.0
+        while update_robot_with_new_origin_and_control_end_effector(robot, origin_trajectory, simulator, t):
+            times.append(t)
+            if self.recorder is not None:
+                self.recorder.record(t, robot.origin_t_1, robot.act_states_t_1.to_array(),
+                                     robot.get_frames()[:, 0:3, 3], simulator.get_control_metrics(robot))
+            t = self.next_time(simulator, t)
+
+        if self.recorder is not None:
+            self.recorder.end_motion()
+
+        # Preserve the robot origin and actuator states, as at the end of a stream
+        robot.reset_velocity_and_acceleration()
+        robot.origin_t_0 = robot.origin_t_1
+        robot.act_states_t_0 = robot.act_states_t_1
+
+        return get_simulation_metrics(simulator, times)
+
+    def next_time(self, simulator: ControlSimulator, t: float) -> float:
+        if self.time_step is not None:
+            return t + self.time_step
+
+        # Step just past the next signal, so the simulator does not miss it due to rounding
+        next_sensor_signal = simulator.time_of_last_sensor_signal + 1 / simulator.origin_sensor_frequency
+        next_control_signal = simulator.time_of_last_control_signal + 1 / simulator.control_frequency
+        return max(min(next_sensor_signal, next_control_signal), t) + 1e-9
+
+
+def get_simulation_metrics(simulator: ControlSimulator, times: list) -> dict[str, np.ndarray]:
+    """Convert the metrics recorded by the simulator to arrays"""
+    return {
+        "time": np.asarray(times),
+        "actual_x": np.asarray(simulator.actual_x_positions),
+        "actual_y": np.asarray(simulator.actual_y_positions),
+        "actual_z": np.asarray(simulator.actual_z_positions),
+        "target_x": np.asarray(simulator.target_x_positions),
+        "target_y": np.asarray(simulator.target_y_positions),
+        "target_z": np.asarray(simulator.target_z_positions),
+        "d1_control_signals": np.asarray(simulator.d1_control_signals),
+        "t1_control_signals": np.asarray(simulator.t1_control_signals),
+        "t2_control_signals": np.asarray(simulator.t2_control_signals),
+        "t3_control_signals": np.asarray(simulator.t3_control_signals),
+        "d1_errors": np.asarray(simulator.d1_errors),
+        "t1_errors": np.asarray(simulator.t1_errors),
+        "t2_errors": np.asarray(simulator.t2_errors),
+        "t3_errors": np.asarray(simulator.t3_errors),
+    }
@@ -0,0 +1,176 @@
+import bisect
+import threading
+
+# Upper bounds of the stage histograms in seconds, from a few microseconds up to past the period of a 50 fps frame
+STAGE_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2e-2, 5e-2)
+
+
+class Counter(object):
+    """A count that only goes up"""
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.__lock:
+            self.value += amount
+
+    def collect(self) -> float:
+        return self.value
+
+
+class Gauge(object):
+    """A value that goes up and down"""
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def collect(self) -> float:
+        return self.value
+
+
+class Histogram(object):
+    """
+    Counting observations in buckets of upper bounds, along with their sum
+    Observations are recorded from the event loop and from planning threads, so updates are taken under a lock
+    """
+    kind = "histogram"
+
+    def __init__(self, buckets: tuple = STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.__lock = threading.Lock()
+
+    def observe(self, value: float, count: int = 1) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            self.bucket_counts[index] += count
+            self.sum += value * count
+            self.count += count
+
+    def observe_batch(self, total: float, count: int) -> None:
+        """Observe the time of a batch as the average time per item, once for every item"""
+        if count > 0:
+            self.observe(total / count, count)
+
+    def collect(self) -> tuple:
+        with self.__lock:
+            return self.buckets, list(self.bucket_counts), self.sum, self.count
+
+
+class MetricsRegistry(object):
+    """
+    The metrics of a process, by name and labels
+    Metrics are collected as plain tuples, so the metrics of the session workers can be sent over their pipe and
+    merged with the metrics of the front process
+    """
+
+    def __init__(self):
+        self.metrics: dict[tuple[str, tuple], Counter | Gauge | Histogram] = {}
+        self.descriptions: dict[str, str] = {}
+
+    def counter(self, name: str, description: str, **labels) -> Counter:
+        return self.register(name, description, labels, Counter)
+
+    def gauge(self, name: str, description: str, **labels) -> Gauge:
+        return self.register(name, description, labels, Gauge)
+
+    def histogram(self, name: str, description: str, **labels) -> Histogram:
+        return self.register(name, description, labels, Histogram)
+
+    def register(self, name: str, description: str, labels: dict, create) -> Counter | Gauge | Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.metrics:
+            self.metrics[key] = create()
+            self.descriptions[name] = description
+        return self.metrics[key]
+
+    def collect(self) -> list[tuple]:
+        """Get (name, labels, kind, description, value) of every metric"""
+        return [(name, labels, metric.kind, self.descriptions[name], metric.collect())
+                for (name, labels), metric in self.metrics.items()]
+
+
+def merge_samples(collections: list[list[tuple]]) -> list[tuple]:
+    """Merge the collected metrics of multiple processes, values of the same metric are added up"""
+    merged = {}
+    for samples in collections:
+        for name, labels, kind, description, value in samples:
+            key = (name, labels)
+            if key not in merged:
+                merged[key] = (name, labels, kind, description, value)
+                continue
+
+            if kind == "histogram":
+                buckets, bucket_counts, total, count = merged[key][4]
+                value = (buckets, [a + b for a, b in zip(bucket_counts, value[1])], total + value[2], count + value[3])
+            else:
+                value = merged[key][4] + value
+            merged[key] = (name, labels, kind, description, value)
+
+    return list(merged.values())
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f"{name}=\"{value}\"" for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def format_metrics(samples: list[tuple]) -> str:
+    """Format collected metrics in the Prometheus text exposition format"""
+    families: dict[str, list[tuple]] = {}
+    for sample in samples:
+        families.setdefault(sample[0], []).append(sample)
+
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family[0][3]}")
+        lines.append(f"# TYPE {name} {family[0][2]}")
+
+        for _, labels, kind, _, value in family:
+            if kind != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {value!r}")
+                continue
+
+            buckets, bucket_counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, "+Inf"), bucket_counts):
+                cumulative += bucket_count
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                lines.append(f"{name}_bucket{format_labels((*labels, ('le', le)))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total!r}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+# The metrics of this process
+metrics = MetricsRegistry()
+
+# Time per frame of the hot-path stages, a batch counts as one observation of its average time for every frame in it
+STAGE_DESCRIPTION = "Time per frame spent in a hot-path stage in seconds, stages may nest"
+FORWARD_KINEMATICS_SECONDS = metrics.histogram("robotcrane_stage_seconds", STAGE_DESCRIPTION,
+                                               stage="forward_kinematics")
+INVERSE_KINEMATICS_SECONDS = metrics.histogram("robotcrane_stage_seconds", STAGE_DESCRIPTION,
+                                               stage="inverse_kinematics")
+TRAJECTORY_SAMPLING_SECONDS = metrics.histogram("robotcrane_stage_seconds", STAGE_DESCRIPTION,
+                                                stage="trajectory_sampling")
+ENCODING_SECONDS = metrics.histogram("robotcrane_stage_seconds", STAGE_DESCRIPTION, stage="encoding")
+SEND_SECONDS = metrics.histogram("robotcrane_stage_seconds", STAGE_DESCRIPTION, stage="send")
+
+MISSED_FRAME_DEADLINES = metrics.counter("robotcrane_missed_frame_deadlines_total",
+                                         "Frame deadlines skipped because the previous frame was late")
+FRAMES_SENT = metrics.counter("robotcrane_frames_sent_total", "Pose frames sent to websocket clients")
+REJECTED_REQUESTS = metrics.counter("robotcrane_rejected_requests_total",
+                                    "Requests answered as invalid, including motions rejected by the planner")
+ACTIVE_SESSIONS = metrics.gauge("robotcrane_active_sessions", "Open robot sessions")
@@ -0,0 +1,140 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from backend.app.models.ActuatorStates import STATE_COUNT
+
+# Channels of a recording and the shape of a single frame, every channel is stored as float64
+CHANNELS = {
+    "time": (),                 # seconds since the start of the motion
+    "origin": (4,),             # origin x, y, z and phi
+    "act_states": (STATE_COUNT,),
+    "joints": (7, 3),           # xyz coordinates of the joints, so replaying needs no kinematics
+    "end_effector": (4,),       # actual end-effector x, y, z and phi, NaN without control
+    "target": (4,),             # target end-effector x, y, z and phi, NaN without control
+    "control_signals": (4,),    # d1, theta 1, theta 2 and theta 3, NaN without control
+    "errors": (4,),             # d1, theta 1, theta 2 and theta 3, NaN without control
+}
+CONTROL_CHANNELS = ("end_effector", "target", "control_signals", "errors")
+INDEX_FILE = "index.json"
+
+
+class MotionRecorder(object):
+    """
+    Recording the pose, actuator and controller series of every motion
+    Frames are written into preallocated buffers that are flushed to one raw float64 file per channel when full, so
+    memory use does not grow with the length of a recording. The index file holds the channel layout, the number of
+    frames on disk and the frames of every motion, and is rewritten on every flush
+    """
+
+    def __init__(self, path: str, capacity: int = 1024):
+        self.path = path
+        self.capacity = capacity
+        os.makedirs(path, exist_ok=True)
+
+        self.buffers = {channel: np.full((capacity, *shape), np.nan) for channel, shape in CHANNELS.items()}
+        self.cursor = 0
+        self.frame_count = 0
+        self.motions = []
+
+        # Continue an existing recording, dropping frames that were written after its last index
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            index = read_index(path)
+            self.frame_count, self.motions = index["frame_count"], index["motions"]
+            if self.motions and self.motions[-1]["end"] is None:
+                self.motions[-1]["end"] = self.frame_count
+
+        self.__files = {}
+        for channel, shape in CHANNELS.items():
+            self.__files[channel] = open(os.path.join(path, f"{channel}.f64"), "ab")
+            self.__files[channel].truncate(self.frame_count * int(np.prod(shape)) * 8)
+
+        self.write_index()
+
+    def start_motion(self, kind: str) -> None:
+        self.end_motion()
+        self.motions.append({"kind": kind, "start": self.frame_count + self.cursor, "end": None,
+                             "started_at": time.time()})
+
+    def end_motion(self) -> None:
+        if self.motions and self.motions[-1]["end"] is None:
+            self.motions[-1]["end"] = self.frame_count + self.cursor
+            self.flush()
+
+    def record(self, t: float, origin: np.ndarray, act_states: np.ndarray, joints: np.ndarray,
+               control_metrics: tuple = None) -> None:
+        """Record a frame, the control metrics are the end effector, target, control signals and errors"""
+        cursor = self.cursor
+        self.buffers["time"][cursor] = t
+        self.buffers["origin"][cursor] = origin
+        self.buffers["act_states"][cursor] = act_states
+        self.buffers["joints"][cursor] = joints
+
+        if control_metrics is not None:
+            for channel, values in zip(CONTROL_CHANNELS, control_metrics):
+                self.buffers[channel][cursor] = values
+        else:
+            for channel in CONTROL_CHANNELS:
+                self.buffers[channel][cursor] = np.nan
+
+        self.cursor += 1
+        if self.cursor == self.capacity:
+            self.flush()
+
+    def flush(self) -> None:
+        """Append the buffered frames to the channel files, the buffers are reused for the next frames"""
+        if self.cursor > 0:
+            for channel, file in self.__files.items():
+                file.write(self.buffers[channel][:self.cursor].tobytes())
+                file.flush()
+
+            self.frame_count += self.cursor
+            self.cursor = 0
+
+        self.write_index()
+
+    def write_index(self) -> None:
+        index = {"channels": {channel: list(shape) for channel, shape in CHANNELS.items()}, "dtype": "<f8",
+                 "frame_count": self.frame_count, "motions": self.motions}
+
+        # Replace the index at once, so readers never see a partially written index
+        index_file = os.path.join(self.path, INDEX_FILE)
+        with open(f"{index_file}.tmp", "w") as file:
+            json.dump(index, file)
+        os.replace(f"{index_file}.tmp", index_file)
+
+    def close(self) -> None:
+        self.end_motion()
+        self.flush()
+        for file in self.__files.values():
+            file.close()
+
+
+def find_recording(recordings_path: str, name: str) -> str:
+    """Get the path of a recording by name, only recordings directly in the recordings path are found"""
+    path = os.path.join(recordings_path, name)
+    if os.path.basename(name) != name or name.startswith(".") or not os.path.exists(os.path.join(path, INDEX_FILE)):
+        raise ValueError(f"Unknown recording: {name}")
+    return path
+
+
+def read_index(path: str) -> dict:
+    with open(os.path.join(path, INDEX_FILE)) as file:
+        return json.load(file)
+
+
+def load_recording(path: str) -> tuple[dict, dict[str, np.ndarray]]:
+    """Open a recording as read-only memory maps per channel, up to the frames in its index"""
+    index = read_index(path)
+
+    channels = {}
+    for channel, shape in index["channels"].items():
+        if index["frame_count"] == 0:
+            channels[channel] = np.empty((0, *shape))
+        else:
+            channels[channel] = np.memmap(os.path.join(path, f"{channel}.f64"), dtype=index["dtype"], mode='r',
+                                          shape=(index["frame_count"], *shape))
+
+    return index, channels
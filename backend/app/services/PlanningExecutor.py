@@ -0,0 +1,54 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class PlanningExecutor(object):
+    """
+    Running CPU-heavy planning and simulation in a thread pool, so the event loop only emits frames
+    Threads are used since planning works on a copy of the robot of a session, and the numpy kernels release the GIL.
+    The number of jobs is bounded, a job beyond the bound is rejected instead of queued, and every job has a timeout.
+    A job that times out keeps its thread until it finishes, so it still counts towards the bound, but its result
+    is discarded
+    """
+
+    def __init__(self, max_workers: int = 4, max_jobs: int = 16, timeout: float = 10.0):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="planning")
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.job_count = 0
+        self.timed_out_jobs = 0
+        self.rejected_jobs = 0
+
+    async def run(self, function: Callable, *args, timeout: float = None) -> Any:
+        """Run the function on the pool and wait for its result, raises a ValueError when busy or timed out"""
+        if self.job_count >= self.max_jobs:
+            self.rejected_jobs += 1
+            raise ValueError("Too many planning requests, try again later")
+
+        loop = asyncio.get_running_loop()
+        self.job_count += 1
+
+        # A job cancelled by its timeout before it started finishes as well
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.finish_job))
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.timed_out_jobs += 1
+            future.add_done_callback(close_result)
+            raise ValueError(f"Planning took longer than {timeout} s")
+
+    def finish_job(self) -> None:
+        self.job_count -= 1
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def close_result(future: Future) -> None:
+    """Close the planned motion of a job whose result is discarded, so the coroutine is not left unawaited"""
+    if not future.cancelled() and future.exception() is None and asyncio.iscoroutine(future.result()):
+        future.result().close()
@@ -0,0 +1,109 @@
+import struct
+from time import time
+
+from backend.app.views.WireFormat import WireFormat
+
+# Frame types of binary pose messages, a full pose frame also serves as keyframe for delta frames
+POSE_FRAME = 0
+DELTA_FRAME = 1
+
+# Binary header: frame type, 3 padding bytes, sequence number and unix timestamp in milliseconds
+POSE_HEADER = struct.Struct("<BxxxIQ")
+
+# Binary pose record: xyz of the seven joints followed by the four angles
+POSE_RECORD = struct.Struct("<25f")
+
+# Delta record: bitmask of the changed pose record fields, followed by an int16 per changed field
+DELTA_MASK = struct.Struct("<I")
+DELTA_QUANTUM = 1e-5
+DELTA_LIMIT = 32767
+
+POSE_JOINTS = ("j_1", "j_2", "j_3", "j_4", "j_5", "j_6", "j_7")
+POSE_ANGLES = ("theta_0", "theta_1", "theta_2", "theta_3")
+
+
+def flatten_pose_data(pose_data: dict) -> list:
+    """Flatten pose data to the 25 values of a pose record"""
+    values = []
+    for joint in POSE_JOINTS:
+        values.extend(pose_data[joint])
+    values.extend(pose_data[angle] for angle in POSE_ANGLES)
+    return values
+
+
+def encode_pose_record(pose_data: dict, sequence: int, timestamp_ms: int) -> bytes:
+    """Encode pose data as a little-endian binary message, a 16 byte header followed by a 100 byte float32 record"""
+    return POSE_HEADER.pack(POSE_FRAME, sequence, timestamp_ms) + POSE_RECORD.pack(*flatten_pose_data(pose_data))
+
+
+def quantize_pose_deltas(values: list, reference: list) -> list | None:
+    """Quantize the differences with the reference pose record, None when a difference does not fit an int16"""
+    deltas = [round((value - ref) / DELTA_QUANTUM) for value, ref in zip(values, reference)]
+    if any(abs(delta) > DELTA_LIMIT for delta in deltas):
+        return None
+    return deltas
+
+
+def encode_pose_delta(deltas: list, sequence: int, timestamp_ms: int) -> bytes:
+    """Encode quantized pose deltas as a binary message, only containing the fields that changed"""
+    mask = 0
+    changed = []
+    for field, delta in enumerate(deltas):
+        if delta != 0:
+            mask |= 1 << field
+            changed.append(delta)
+
+    return (POSE_HEADER.pack(DELTA_FRAME, sequence, timestamp_ms) + DELTA_MASK.pack(mask)
+            + struct.pack(f"<{len(changed)}h", *changed))
+
+
+class PoseEncoder(object):
+    """Encoding poses for a client in the wire format it negotiated"""
+
+    def __init__(self, wire_format: WireFormat = WireFormat.json, keyframe_interval: int = 50):
+        self.wire_format = wire_format
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+
+        # Pose record as reconstructed by the client, and frames sent since the last keyframe
+        self.reference = None
+        self.frames_since_keyframe = 0
+
+    def set_wire_format(self, wire_format: WireFormat) -> None:
+        self.wire_format = wire_format
+        self.sequence = 0
+        self.reference = None
+
+    def encode(self, pose_data: dict) -> dict | bytes:
+        """Encode pose data, as a json message by default or as a binary message"""
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+
+        if self.wire_format is WireFormat.binary:
+            return encode_pose_record(pose_data, self.sequence, round(time() * 1000))
+
+        if self.wire_format is WireFormat.delta:
+            return self.encode_delta(pose_data)
+
+        return {"pose_data": pose_data}
+
+    def encode_delta(self, pose_data: dict) -> bytes:
+        """Encode a keyframe periodically, and in between the quantized changes against the client reconstruction"""
+        values = flatten_pose_data(pose_data)
+        timestamp_ms = round(time() * 1000)
+
+        deltas = None
+        if self.reference is not None and self.frames_since_keyframe < self.keyframe_interval:
+            deltas = quantize_pose_deltas(values, self.reference)
+
+        if deltas is None:
+            message = encode_pose_record(pose_data, self.sequence, timestamp_ms)
+
+            # The client holds the float32 values of the keyframe
+            self.reference = list(POSE_RECORD.unpack_from(message, POSE_HEADER.size))
+            self.frames_since_keyframe = 1
+            return message
+
+        # Track the reconstruction of the client, so quantization errors do not accumulate
+        self.reference = [ref + delta * DELTA_QUANTUM for ref, delta in zip(self.reference, deltas)]
+        self.frames_since_keyframe += 1
+        return encode_pose_delta(deltas, self.sequence, timestamp_ms)
@@ -0,0 +1,101 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from backend.app.models.ActuatorStates import ActuatorStates, STATE_COUNT, from_array
+
+# Layout of a frame: the pose as sent to the frontend, followed by the origin and actuator states of the robot
+JOINT_KEYS = ("j_1", "j_2", "j_3", "j_4", "j_5", "j_6", "j_7")
+ANGLE_KEYS = ("theta_0", "theta_1", "theta_2", "theta_3")
+JOINTS = slice(0, 21)
+ANGLES = slice(21, 25)
+ORIGIN = slice(25, 29)
+ACT_STATES = slice(29, 29 + STATE_COUNT)
+FRAME_SIZE = 29 + STATE_COUNT
+
+
+class PoseRing(object):
+    """
+    Ring buffer of robot frames in shared memory, written by one process and read by another without copying
+    The shared memory holds the number of written frames, the sequence number of every slot and the frames.
+    The writer invalidates a slot before filling it and publishes its sequence number afterwards, the reader checks
+    that sequence number before and after reading a frame, so a frame that is overwritten while reading is never used
+    """
+
+    def __init__(self, shared_memory: SharedMemory, capacity: int):
+        self.shared_memory = shared_memory
+        self.capacity = capacity
+
+        self.header = np.ndarray((1,), dtype=np.int64, buffer=shared_memory.buf)
+        self.sequences = np.ndarray((capacity,), dtype=np.int64, buffer=shared_memory.buf, offset=8)
+        self.frames = np.ndarray((capacity, FRAME_SIZE), dtype=np.float64, buffer=shared_memory.buf,
+                                 offset=8 * (1 + capacity))
+
+    @staticmethod
+    def create(capacity: int = 64) -> 'PoseRing':
+        shared_memory = SharedMemory(create=True, size=8 * (1 + capacity + capacity * FRAME_SIZE))
+        ring = PoseRing(shared_memory, capacity)
+        ring.header[0] = 0
+        ring.sequences[:] = 0
+        return ring
+
+    @staticmethod
+    def attach(name: str, capacity: int = 64) -> 'PoseRing':
+        return PoseRing(SharedMemory(name=name), capacity)
+
+    @property
+    def name(self) -> str:
+        return self.shared_memory.name
+
+    @property
+    def write_count(self) -> int:
+        return int(self.header[0])
+
+    def write(self, pose_data: dict, origin: tuple, act_states: ActuatorStates) -> None:
+        """Write the next frame, only a single process may write to the ring"""
+        sequence = self.write_count + 1
+        slot = sequence % self.capacity
+
+        self.sequences[slot] = 0
+        frame = self.frames[slot]
+        frame[JOINTS] = np.ravel([pose_data[key] for key in JOINT_KEYS])
+        frame[ANGLES] = [pose_data[key] for key in ANGLE_KEYS]
+        frame[ORIGIN] = origin
+        frame[ACT_STATES] = act_states.to_array()
+        self.sequences[slot] = sequence
+
+        self.header[0] = sequence
+
+    def read_latest(self, sequence: int = 0) -> tuple[int, dict, tuple, ActuatorStates] | None:
+        """
+        Read the latest frame when it is newer than the given sequence number
+        Returns its sequence number, the pose data, the origin and the actuator states
+        """
+        for _ in range(3):
+            latest = self.write_count
+            if latest == sequence:
+                return None
+
+            slot = latest % self.capacity
+            if self.sequences[slot] != latest:
+                continue
+
+            values = self.frames[slot].tolist()
+            act_states = from_array(self.frames[slot, ACT_STATES], copy=True)
+            if self.sequences[slot] != latest:
+                continue
+
+            pose_data = {key: values[3 * i:3 * i + 3] for i, key in enumerate(JOINT_KEYS)}
+            pose_data |= dict(zip(ANGLE_KEYS, values[ANGLES]))
+            return latest, pose_data, tuple(values[ORIGIN]), act_states
+
+        # The writer keeps overtaking the reader, the frame is read on the next attempt
+        return None
+
+    def close(self) -> None:
+        # The views into the shared memory have to be released before it can be closed
+        self.header = self.sequences = self.frames = None
+        self.shared_memory.close()
+
+    def unlink(self) -> None:
+        self.shared_memory.unlink()
@@ -1,143 +1,210 @@
 import asyncio
-from time import time
-
-from fastapi import WebSocket
+import copy
+import logging
+from typing import Coroutine
 
+import numpy as np
+from backend.app.models.ActuatorStates import ActuatorStates
+from backend.app.models.LinearTrajectory import LinearTrajectory
 from backend.app.models.OriginTrajectory import OriginTrajectory
+from backend.app.models.PathTrajectory import PathTrajectory
 from backend.app.models.Pose import Pose
+from backend.app.models.PoseBuffer import PoseBuffer
+from backend.app.models.RecordedMotion import RecordedMotion
 from backend.app.models.RobotCrane import RobotCrane
 from backend.app.models.Trajectory import Trajectory
 from backend.app.services.ControlSimulator import ControlSimulator
-from backend.app.views.WebSocketAPI import WebSocketAPI
-
-
-def get_current_time_ms() -> int:
-    """Return the current time in milliseconds."""
-    return round(time() * 1000)
-
-
-def update_robot(robot: RobotCrane, _, trajectory: Trajectory, elapsed_time_in_seconds: float) -> bool:
-    next_act_state = trajectory.next_step(elapsed_time_in_seconds)
+from backend.app.services.FrameScheduler import FrameScheduler
+from backend.app.services.MotionRecorder import MotionRecorder
+from backend.app.services.tools.ControlHelper import plan_origin_control, \
+    update_robot_with_new_origin_and_control_end_effector, CONTROL_TIME_STEP
+from backend.app.services.tools.PlaybackHelper import precompute_trajectory
 
-    if next_act_state is None:
-        print("No next actuator state found")
-        return False
+logger = logging.getLogger(__name__)
 
-    robot.set_act_states_t_1(next_act_state)
 
-    return True
+def precompute_control(robot: RobotCrane, origin_trajectory: OriginTrajectory,
+                       simulator: ControlSimulator) -> PoseBuffer:
+    """
+    Simulate the origin move with end-effector control on a copy of the robot, at the fixed control step
+    The controllers act on every step, so the step does not follow the streaming rate, frames are picked from the
+    buffer by time when played back. Every frame holds the control metrics as well, so they can be recorded
+    """
+    robot = copy.deepcopy(robot)
 
+    times, states, origins, frames, control_metrics = [], [], [], [], []
+    for t in np.arange(0, simulator.moving_time + CONTROL_TIME_STEP, CONTROL_TIME_STEP):
+        if not update_robot_with_new_origin_and_control_end_effector(robot, origin_trajectory, simulator, t.item()):
+            break
 
-def update_robot_with_new_origin(robot: RobotCrane, origin_trajectory: OriginTrajectory, trajectory: Trajectory,
-                                 elapsed_time_in_seconds: float) -> bool:
-    # Update robot origin
-    next_origin = origin_trajectory.next_step(elapsed_time_in_seconds)
-    if next_origin is None:
-        print("No next origin found, end streaming.")
-        return False
-    robot.set_origin_t_1(next_origin)
+        times.append(t)
+        states.append(robot.act_states_t_1.to_array())
+        origins.append(robot.origin_t_1)
+        frames.append(robot.get_frames())
+        control_metrics.append(simulator.get_control_metrics(robot))
 
-    # Update robot actuator states
-    next_act_state = trajectory.next_step(elapsed_time_in_seconds)
-    if next_act_state is None:
-        print("No next actuator state found, end streaming.")
-        return False
-    robot.set_act_states_t_1(next_act_state)
+    # Without any step the robot stays where it is
+    if not times:
+        times, states, origins, frames = [0.0], [robot.act_states_t_0.to_array()], [robot.origin_t_0], \
+            [robot.get_frames()]
+        control_metrics.append(simulator.get_control_metrics(robot))
 
-    return True
+    states = np.array(states)
+    return PoseBuffer(np.array(times), *np.split(states, 3, axis=1), np.array(origins, dtype=float), np.array(frames),
+                      tuple(np.array(metric) for metric in zip(*control_metrics)))
 
 
-def update_robot_with_new_origin_and_control_end_effector(robot: RobotCrane, origin_trajectory: OriginTrajectory,
-                                                          simulator: ControlSimulator,
-                                                          elapsed_time_in_seconds: float) -> bool:
-    # Get the next origin
-    next_origin = origin_trajectory.next_step(elapsed_time_in_seconds)
-    if next_origin is None:
-        print("No next origin found, end streaming.")
-        return False
-
-    # Update robot actuator states
-    robot = simulator.next_step(robot, elapsed_time_in_seconds, next_origin)
-    if robot is None:
-        print("No next step found, end streaming.")
-        return False
-
-    return True
+# Replay speed limits, as a factor of real time
+MIN_REPLAY_SPEED = 0.25
+MAX_REPLAY_SPEED = 10.0
 
 
 class RobotPoseStreamer(object):
+    """Planning motions and playing them back on the frame schedule, subclasses send the poses to their subscribers"""
 
-    def __init__(self, websocket: WebSocket, websocket_api: WebSocketAPI):
+    def __init__(self, recorder: MotionRecorder = None):
         self.streaming_frequency = 50
-        self.last_signal_time_ms = 0
-        self.websocket = websocket
-        self.websocket_api = websocket_api
-
-    async def stream_poses(self, robot: RobotCrane) -> None:
-        trajectory = Trajectory(robot.act_states_t_0, robot.act_states_t_1, robot.max_vel, robot.max_acc,
-                                robot.max_ang_vel, robot.max_ang_acc)
-        print(f"Moving time: {trajectory.get_moving_time()}")
+        self.scheduler = FrameScheduler(self.streaming_frequency)
 
-        await self.stream(robot, None, trajectory, update_robot)
+        # Optionally record every streamed frame
+        self.recorder = recorder
 
-    async def stream_poses_for_new_origin(self, robot: RobotCrane) -> None:
-        origin_trajectory = OriginTrajectory(robot.origin_t_0, robot.origin_t_1)
+    def set_streaming_frequency(self, frequency: float) -> None:
+        """Change the streaming frequency, a running motion continues at the new frequency"""
+        self.streaming_frequency = frequency
+        self.scheduler.set_frequency(frequency)
 
+    def plan_poses(self, robot: RobotCrane) -> Coroutine:
+        """Plan the motion to the actuator states of the robot, returns the coroutine streaming it"""
         trajectory = Trajectory(robot.act_states_t_0, robot.act_states_t_1, robot.max_vel, robot.max_acc,
                                 robot.max_ang_vel, robot.max_ang_acc)
-        trajectory.set_moving_time(origin_trajectory.min_move_time)
-
-        print(f"Moving time: {trajectory.get_moving_time()}")
+        logger.debug("Moving time: %s", trajectory.get_moving_time())
 
-        await self.stream(robot, origin_trajectory, trajectory, update_robot_with_new_origin)
+        pose_buffer = precompute_trajectory(robot, trajectory, self.streaming_frequency)
+        return self.play(robot, pose_buffer)
 
-    async def stream_poses_for_new_origin_and_control_end_effector(self, robot: RobotCrane) -> None:
-        # Fetch the new origin
-        new_org = robot.origin_t_1
+    def plan_linear_end_effector(self, robot: RobotCrane, trajectory: LinearTrajectory) -> Coroutine:
+        """Plan the straight line of the end effector, returns the coroutine streaming it"""
+        logger.debug("Moving time: %s", trajectory.get_moving_time())
 
-        # Reset the robot origin
-        robot.set_origin_t_1(robot.origin_t_0)
+        pose_buffer = precompute_trajectory(robot, trajectory, self.streaming_frequency)
+        return self.play(robot, pose_buffer)
 
-        org_traj = OriginTrajectory(robot.origin_t_0, new_org)
-        print(f"Moving time: {org_traj.get_moving_time()}")
+    def plan_path(self, robot: RobotCrane, waypoints: list[ActuatorStates]) -> Coroutine:
+        """Plan a blended motion through the waypoints, ending at the actuator states of the robot"""
+        trajectory = PathTrajectory([robot.act_states_t_0, *waypoints], robot.max_vel, robot.max_acc,
+                                    robot.max_ang_vel, robot.max_ang_acc)
+        logger.debug("Moving time: %s", trajectory.get_moving_time())
 
-        simulator = ControlSimulator(org_traj.get_moving_time(), robot)
+        pose_buffer = precompute_trajectory(robot, trajectory, self.streaming_frequency)
+        return self.play(robot, pose_buffer)
 
-        await self.stream(robot, org_traj, simulator, update_robot_with_new_origin_and_control_end_effector)
+    def plan_poses_for_new_origin(self, robot: RobotCrane) -> Coroutine:
+        """Plan the motion to the origin and actuator states of the robot, returns the coroutine streaming it"""
+        origin_trajectory = OriginTrajectory(robot.origin_t_0, robot.origin_t_1)
 
-    async def stream(self, robot: RobotCrane, origin_next_step_provider, next_step_provider, update_function) -> None:
-        start_time_ms = get_current_time_ms()
+        trajectory = Trajectory(robot.act_states_t_0, robot.act_states_t_1, robot.max_vel, robot.max_acc,
+                                robot.max_ang_vel, robot.max_ang_acc)
+        # The actuators move within the moving time of the origin, unless they need longer to stay within their limits
+        trajectory.set_moving_time(max(origin_trajectory.min_move_time, trajectory.get_moving_time()))
+
+        logger.debug("Moving time: %s", trajectory.get_moving_time())
+
+        pose_buffer = precompute_trajectory(robot, trajectory, self.streaming_frequency, origin_trajectory)
+        return self.play(robot, pose_buffer)
+
+    def plan_poses_for_new_origin_and_control_end_effector(self, robot: RobotCrane) -> Coroutine:
+        """Plan the origin motion while controlling the end effector, returns the coroutine streaming it"""
+        org_traj, simulator = plan_origin_control(robot)
+        logger.debug("Moving time: %s", org_traj.get_moving_time())
+
+        pose_buffer = precompute_control(robot, org_traj, simulator)
+        return self.play(robot, pose_buffer)
+
+    async def play(self, robot: RobotCrane, pose_buffer: PoseBuffer) -> None:
+        """Play back a precomputed motion, only indexing into the buffer by the elapsed time"""
+        self.scheduler.start()
+        if self.recorder is not None:
+            self.recorder.start_motion("playback" if pose_buffer.control_metrics is None else "control")
+
+        index = None
+        try:
+            while True:
+                current_time_ms = await self.scheduler.wait_for_next_frame()
+
+                # Streaming faster than the buffer was sampled, frames are only sent once
+                next_index = pose_buffer.get_index(self.scheduler.get_elapsed_time_in_seconds(current_time_ms))
+                if next_index == index:
+                    continue
+                index = next_index
+
+                # Keep the robot in sync with the frame that is sent
+                robot.set_origin_t_1(pose_buffer.get_origin(index))
+                robot.set_act_states_t_1(pose_buffer.get_actuator_states(index))
+
+                # Send the pose to the frontend via websocket
+                await self.send_pose(pose_buffer.get_pose_data(index))
+
+                if self.recorder is not None:
+                    self.recorder.record(pose_buffer.times[index], pose_buffer.origins[index],
+                                         pose_buffer.states[index], pose_buffer.joints[index],
+                                         pose_buffer.get_control_metrics(index))
+
+                if index == len(pose_buffer) - 1:
+                    logger.debug("End of pose buffer, end streaming.")
+                    break
+
+        except asyncio.CancelledError:
+            self.end_stream(robot, preempted=True)
+            raise
+
+        self.end_stream(robot)
+
+    def plan_replay(self, recorded_motion: RecordedMotion, speed: float = 1.0, position: float = 0.0) -> Coroutine:
+        """Plan the replay of a recorded motion from a position in seconds, returns the coroutine streaming it"""
+        if not MIN_REPLAY_SPEED <= speed <= MAX_REPLAY_SPEED:
+            raise ValueError(f"Replay speed should be between {MIN_REPLAY_SPEED} and {MAX_REPLAY_SPEED}")
+        if not 0 <= position <= recorded_motion.get_moving_time():
+            raise ValueError(f"Replay position should be between 0 and {recorded_motion.get_moving_time():.2f} s")
+
+        logger.debug("Replay time: %s", (recorded_motion.get_moving_time() - position) / speed)
+        return self.replay(recorded_motion, speed, position)
+
+    async def replay(self, recorded_motion: RecordedMotion, speed: float, position: float) -> None:
+        """Replay a recorded motion, the robot itself does not move"""
+        self.scheduler.start()
+        index = None
         while True:
-            current_time_ms = get_current_time_ms()
+            current_time_ms = await self.scheduler.wait_for_next_frame()
 
-            if not self.should_update_pose(current_time_ms):
-                continue
+            elapsed_time_in_seconds = position + speed * self.scheduler.get_elapsed_time_in_seconds(current_time_ms)
+            next_index = recorded_motion.get_index(elapsed_time_in_seconds)
 
-            elapsed_time_in_seconds = (current_time_ms - start_time_ms) / 1000
-            if not update_function(robot, origin_next_step_provider, next_step_provider, elapsed_time_in_seconds):
-                print("End streaming.")
-                break
+            # When replaying slower than recorded, frames are only sent once
+            if next_index != index:
+                index = next_index
+                await self.send_pose(recorded_motion.get_pose_data(index))
 
-            # Send the pose to the frontend via websocket
-            pose = Pose(robot.get_frames(), robot.origin_t_1, robot.act_states_t_1)
-            await self.websocket_api.send_json_message(self.websocket, {"pose_data": pose.__dict__})
+            if index == len(recorded_motion) - 1:
+                logger.debug("End of recorded motion, end replay.")
+                break
 
-            # Yield control to the event loop
-            await asyncio.sleep(0)
+    async def send_pose(self, pose_data: dict) -> None:
+        """Send the pose to the subscribers of the motion"""
+        raise NotImplementedError
 
-            # Update the last time a signal was processed
-            self.last_signal_time_ms = current_time_ms
+    def end_stream(self, robot: RobotCrane, preempted: bool = False) -> None:
+        if self.scheduler.missed_deadlines > 0:
+            logger.warning("Missed %d of %d frame deadlines", self.scheduler.missed_deadlines,
+                           self.scheduler.frame_count)
 
-        # Reset last signal time
-        self.last_signal_time_ms = 0
+        if self.recorder is not None:
+            self.recorder.end_motion()
 
-        # Reset velocity and acceleration
-        robot.reset_velocity_and_acceleration()
+        # Reset velocity and acceleration, a preempted motion keeps them so the next motion continues smoothly
+        if not preempted:
+            robot.reset_velocity_and_acceleration()
 
         # Preserve the robot origin and actuator states
         robot.origin_t_0 = robot.origin_t_1
         robot.act_states_t_0 = robot.act_states_t_1
-
-    def should_update_pose(self, current_time_ms: int) -> bool:
-        """Check if enough time has passed to update the pose."""
-        return (current_time_ms - self.last_signal_time_ms) >= (1 / self.streaming_frequency) * 1000
@@ -0,0 +1,283 @@
+import asyncio
+import copy
+import json
+import logging
+import math
+from time import perf_counter
+from typing import Callable, Coroutine
+
+from fastapi import WebSocket
+
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.FrameScheduler import get_current_time_ms
+from backend.app.services.Metrics import ENCODING_SECONDS, SEND_SECONDS, FRAMES_SENT
+from backend.app.services.MotionRecorder import MotionRecorder
+from backend.app.services.PlanningExecutor import PlanningExecutor
+from backend.app.services.PoseEncoder import PoseEncoder
+from backend.app.services.RobotPoseStreamer import RobotPoseStreamer
+from backend.app.services.tools.RecordingHelper import open_recorded_motion
+from backend.app.services.tools.RobotUpdateHelper import set_actuator_states, set_end_effectors, set_new_origin, \
+    set_path, set_end_effector_linear
+from backend.app.views.RobotTask import RobotTask
+from backend.app.views.WebSocketAPI import WebSocketAPI
+
+logger = logging.getLogger(__name__)
+
+# Streaming rates a client can negotiate, in frames per second
+DEFAULT_STREAMING_RATE = 50
+MIN_STREAMING_RATE = 5
+MAX_STREAMING_RATE = 240
+
+
+class PoseSubscriber(object):
+    """
+    A websocket subscribed to the poses of a robot session, at its own streaming rate
+    Only the latest pose waits to be sent, at the rate of the subscriber, so a slow link skips intermediate poses
+    instead of queuing them. The rate adapts down when sending backs up and back up when it clears
+    """
+
+    def __init__(self, websocket: WebSocket, websocket_api: WebSocketAPI, target_rate: float = DEFAULT_STREAMING_RATE):
+        self.websocket = websocket
+        self.websocket_api = websocket_api
+        self.pose_encoder = PoseEncoder()
+
+        self.target_rate = target_rate
+        self.rate = target_rate
+        self.send_time_ms = 0.0
+        self.next_pose_time_ms = 0.0
+
+        self.pending_pose: dict | None = None
+        self.pose_ready = asyncio.Event()
+        self.skipped_poses = 0
+
+    def set_target_rate(self, rate: float) -> None:
+        # NaN passes the clamp below unchanged, and would break the frame scheduler of every subscriber
+        if not math.isfinite(rate):
+            raise ValueError(f"Streaming rate should be a finite number, not {rate}")
+        self.target_rate = min(max(rate, MIN_STREAMING_RATE), MAX_STREAMING_RATE)
+        self.rate = self.target_rate
+
+    def push(self, pose_data: dict) -> None:
+        """Replace the pose waiting to be sent, the latest pose is sent once it is due at the rate of the subscriber"""
+        if self.pending_pose is not None:
+            self.skipped_poses += 1
+
+        self.pending_pose = pose_data
+        self.pose_ready.set()
+
+    async def send_poses(self) -> None:
+        """Send the latest pose to the websocket, in the wire format of the subscriber"""
+        while True:
+            await self.pose_ready.wait()
+            self.pose_ready.clear()
+
+            # Newer poses replace the pending pose while waiting until it is due
+            delay_ms = self.next_pose_time_ms - get_current_time_ms()
+            if delay_ms > 0:
+                await asyncio.sleep(delay_ms / 1000)
+
+            pose_data, self.pending_pose = self.pending_pose, None
+            if pose_data is None:
+                continue
+
+            # Poses are due on a fixed period, unless the subscriber fell more than a period behind
+            start_time_ms = get_current_time_ms()
+            period_ms = 1000 / self.rate
+            if start_time_ms - self.next_pose_time_ms > period_ms:
+                self.next_pose_time_ms = start_time_ms
+            self.next_pose_time_ms += period_ms
+
+            # Json messages are serialized here instead of by the websocket, so encoding and sending are timed apart
+            encode_start = perf_counter()
+            message = self.pose_encoder.encode(pose_data)
+            if not isinstance(message, bytes):
+                message = json.dumps(message)
+
+            send_start = perf_counter()
+            ENCODING_SECONDS.observe(send_start - encode_start)
+            if isinstance(message, bytes):
+                await self.websocket_api.send_bytes_message(self.websocket, message)
+            else:
+                await self.websocket_api.send_message(self.websocket, message)
+            SEND_SECONDS.observe(perf_counter() - send_start)
+            FRAMES_SENT.inc()
+
+            self.adapt_rate(get_current_time_ms() - start_time_ms)
+
+    def adapt_rate(self, send_time_ms: float) -> None:
+        """Lower the rate when sending takes a large part of the period, raise it again towards the target when not"""
+        self.send_time_ms = 0.8 * self.send_time_ms + 0.2 * send_time_ms
+        period_ms = 1000 / self.rate
+
+        if self.send_time_ms > 0.5 * period_ms:
+            self.rate = max(self.rate * 0.75, MIN_STREAMING_RATE)
+        elif self.send_time_ms < 0.1 * period_ms and self.rate < self.target_rate:
+            self.rate = min(self.rate * 1.05, self.target_rate)
+
+
+class BroadcastPoseStreamer(RobotPoseStreamer):
+    """Streaming the poses of a robot session once, to all of its subscribers"""
+
+    def __init__(self, session: 'RobotSession'):
+        super().__init__()
+        self.session = session
+
+    async def send_pose(self, pose_data: dict) -> None:
+        self.session.publish(pose_data)
+
+
+class RobotSession(object):
+    """A robot simulation shared by all the websockets subscribed to it"""
+
+    def __init__(self, name: str, shared: bool, executor: PlanningExecutor, recordings_path: str = None):
+        self.name = name
+        self.shared = shared
+        self.robot = RobotCrane()
+        self.recordings_path = recordings_path
+
+        # Planning runs off the event loop
+        self.executor = executor
+
+        self.subscribers: list[PoseSubscriber] = []
+        self.__send_tasks: dict[PoseSubscriber, asyncio.Task] = {}
+
+        # Only one motion is streamed at a time, commands are handled one by one and preempt the current motion
+        self.command_lock = asyncio.Lock()
+        self.motion_task: asyncio.Task | None = None
+        self.streamer = BroadcastPoseStreamer(self)
+
+    def subscribe(self, websocket: WebSocket, websocket_api: WebSocketAPI) -> PoseSubscriber:
+        subscriber = PoseSubscriber(websocket, websocket_api)
+        self.subscribers.append(subscriber)
+        self.__send_tasks[subscriber] = asyncio.create_task(subscriber.send_poses())
+        self.update_streaming_frequency()
+        return subscriber
+
+    def unsubscribe(self, subscriber: PoseSubscriber) -> None:
+        self.subscribers.remove(subscriber)
+        self.__send_tasks.pop(subscriber).cancel()
+        self.update_streaming_frequency()
+
+    def set_streaming_rate(self, subscriber: PoseSubscriber, rate: float) -> None:
+        subscriber.set_target_rate(rate)
+        self.update_streaming_frequency()
+
+    def update_streaming_frequency(self) -> None:
+        """Stream at the highest rate of the subscribers, each subscriber resamples to its own rate"""
+        frequency = max((subscriber.target_rate for subscriber in self.subscribers), default=DEFAULT_STREAMING_RATE)
+        if frequency != self.streamer.streaming_frequency:
+            self.streamer.set_streaming_frequency(frequency)
+
+    def publish(self, pose_data: dict) -> None:
+        """Fan a pose out to all subscribers, the pose is computed once regardless of the number of subscribers"""
+        for subscriber in self.subscribers:
+            subscriber.push(pose_data)
+
+    async def move(self, action: RobotTask, data: json) -> None:
+        """Start the motion of a motion task, preempting the current motion"""
+        match action:
+            case RobotTask.replay:
+                recorded_motion = open_recorded_motion(self.recordings_path, data)
+                await self.start_motion(lambda robot: None,
+                                        lambda robot: self.streamer.plan_replay(
+                                            recorded_motion, float(data.get("speed", 1.0)),
+                                            float(data.get("position", 0.0))))
+
+            case RobotTask.move_actuators:
+                await self.start_motion(lambda robot: set_actuator_states(robot, data), self.streamer.plan_poses)
+
+            case RobotTask.move_end_effector:
+                await self.start_motion(lambda robot: set_end_effectors(robot, data), self.streamer.plan_poses)
+
+            case RobotTask.move_end_effector_linear:
+                await self.start_motion(lambda robot: None,
+                                        lambda robot: self.streamer.plan_linear_end_effector(
+                                            robot, set_end_effector_linear(robot, data)))
+
+            case RobotTask.move_path:
+                await self.start_motion(lambda robot: None,
+                                        lambda robot: self.streamer.plan_path(robot, set_path(robot, data)))
+
+            case RobotTask.move_origin:
+                await self.start_motion(lambda robot: set_new_origin(robot, data),
+                                        self.streamer.plan_poses_for_new_origin)
+
+            case RobotTask.move_origin_control_end_effector:
+                await self.start_motion(lambda robot: set_new_origin(robot, data),
+                                        self.streamer.plan_poses_for_new_origin_and_control_end_effector)
+
+            case _:
+                raise ValueError(f"Not a motion: {action.value}")
+
+    async def start_motion(self, set_target: Callable[[RobotCrane], None],
+                           plan: Callable[[RobotCrane], Coroutine]) -> None:
+        """
+        Preempt the current motion, then set the new target and plan the motion towards it
+        The robot continues from its current position and velocity, and the motion is streamed in the background
+        Planning runs on the executor on a copy of the robot, only streaming the motion runs on the event loop. A
+        planning job that timed out keeps running on its copy, so it cannot change the robot of the session
+        """
+        async with self.command_lock:
+            await self.preempt_motion()
+
+            robot = copy.deepcopy(self.robot)
+            try:
+                set_target(robot)
+                motion = await self.executor.run(plan, robot)
+            except BaseException:
+                # The preempted motion kept its velocity for the next motion, without one the robot stands still
+                self.robot.reset_velocity_and_acceleration()
+                raise
+
+            # The planned robot becomes the robot of the session once planning finished in time, the motion moves it
+            self.robot = robot
+            self.motion_task = asyncio.create_task(self.run_motion(motion))
+
+    async def run_motion(self, motion: Coroutine) -> None:
+        try:
+            await motion
+        except ValueError as e:
+            logger.warning("Motion of session %s failed: %s", self.name, e)
+            await self.send_message(f"Invalid request: {e}")
+
+    async def send_message(self, message: str) -> None:
+        """Send a message to all subscribers"""
+        for subscriber in self.subscribers:
+            await subscriber.websocket_api.send_message(subscriber.websocket, message)
+
+    async def stop_motion(self) -> None:
+        """Stop the current motion, the robot holds its current position"""
+        async with self.command_lock:
+            await self.preempt_motion()
+            self.robot.reset_velocity_and_acceleration()
+
+    async def preempt_motion(self) -> None:
+        if self.motion_task is None:
+            return
+
+        self.motion_task.cancel()
+        try:
+            await self.motion_task
+        except asyncio.CancelledError:
+            pass
+        self.motion_task = None
+
+    def start_recording(self, path: str) -> None:
+        """Record every motion of the session from now on"""
+        self.stop_recording()
+        self.streamer.recorder = MotionRecorder(path)
+
+    def stop_recording(self) -> None:
+        if self.streamer.recorder is not None:
+            self.streamer.recorder.close()
+            self.streamer.recorder = None
+
+    async def reset_robot(self) -> None:
+        async with self.command_lock:
+            await self.preempt_motion()
+            self.robot = RobotCrane()
+
+    def close(self) -> None:
+        if self.motion_task is not None:
+            self.motion_task.cancel()
+        self.stop_recording()
@@ -0,0 +1,79 @@
+import asyncio
+import zlib
+from itertools import count
+
+from backend.app.services.Metrics import ACTIVE_SESSIONS
+from backend.app.services.PlanningExecutor import PlanningExecutor
+from backend.app.services.RobotSession import RobotSession
+from backend.app.services.SessionShard import SessionShard
+from backend.app.services.ShardedRobotSession import ShardedRobotSession
+
+# Names of private sessions, which cannot be joined by name
+PRIVATE_SESSION_PREFIX = "private-"
+
+
+class RobotSessionHub(object):
+    """
+    Keeping track of the robot sessions, named sessions are shared by all the websockets that join them
+    With worker processes, every session is pinned to the worker of its shard by the hash of its name, so the
+    simulations use as many cores as there are workers. Without, the sessions run in this process
+    """
+
+    def __init__(self, executor: PlanningExecutor, recordings_path: str = None, worker_count: int = 0):
+        self.executor = executor
+        self.recordings_path = recordings_path
+        self.worker_count = worker_count
+        self.shards: list[SessionShard] = []
+        self.sessions: dict[str, RobotSession] = {}
+        self.__private_session_ids = count(1)
+
+    def start(self) -> None:
+        """Start the worker processes, from within the event loop"""
+        self.shards = [SessionShard(index, self.recordings_path) for index in range(self.worker_count)]
+
+    def shutdown(self) -> None:
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        ACTIVE_SESSIONS.set(0)
+
+        for shard in self.shards:
+            shard.shutdown()
+        self.shards = []
+
+    def create_session(self, name: str, shared: bool) -> RobotSession:
+        if not self.shards:
+            return RobotSession(name, shared, self.executor, self.recordings_path)
+
+        shard = self.shards[zlib.crc32(name.encode()) % len(self.shards)]
+        return ShardedRobotSession(name, shared, shard)
+
+    def join(self, name: str) -> RobotSession:
+        """Get the named session, creating it for the first subscriber"""
+        if name.startswith(PRIVATE_SESSION_PREFIX):
+            raise ValueError(f"Session names starting with {PRIVATE_SESSION_PREFIX} are reserved")
+
+        if name not in self.sessions:
+            self.sessions[name] = self.create_session(name, shared=True)
+            ACTIVE_SESSIONS.set(len(self.sessions))
+        return self.sessions[name]
+
+    def create_private(self) -> RobotSession:
+        """Create a session for a single websocket"""
+        name = f"{PRIVATE_SESSION_PREFIX}{next(self.__private_session_ids)}"
+        self.sessions[name] = self.create_session(name, shared=False)
+        ACTIVE_SESSIONS.set(len(self.sessions))
+        return self.sessions[name]
+
+    def release(self, session: RobotSession) -> None:
+        """Remove the session once the last subscriber left"""
+        if not session.subscribers and self.sessions.get(session.name) is session:
+            session.close()
+            del self.sessions[session.name]
+            ACTIVE_SESSIONS.set(len(self.sessions))
+
+    async def collect_worker_metrics(self, timeout: float = 1.0) -> list[list[tuple]]:
+        """Collect the metrics of the worker processes, a worker that does not answer in time is left out"""
+        results = await asyncio.gather(*(asyncio.wait_for(shard.call("collect_metrics", None), timeout)
+                                         for shard in self.shards), return_exceptions=True)
+        return [samples for samples in results if not isinstance(samples, BaseException)]
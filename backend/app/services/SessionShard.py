@@ -0,0 +1,89 @@
+import asyncio
+import multiprocessing
+import threading
+from itertools import count
+
+from backend.app.services.SessionWorker import run_session_worker
+
+
+class SessionShard(object):
+    """
+    A worker process simulating the robot sessions pinned to it
+    Commands are sent over a pipe, replies and messages of the worker are received on a thread and handed to the
+    event loop. Poses do not go through the pipe, the worker writes them into a shared-memory ring per session
+    """
+
+    def __init__(self, index: int, recordings_path: str):
+        self.index = index
+        self.loop = asyncio.get_running_loop()
+        self.sessions = {}
+
+        # Spawn instead of fork, the front process runs an event loop and threads
+        context = multiprocessing.get_context("spawn")
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=run_session_worker, args=(worker_connection, recordings_path),
+                                       name=f"session-worker-{index}", daemon=True)
+        self.process.start()
+        worker_connection.close()
+
+        self.__call_ids = count(1)
+        self.__calls: dict[int, asyncio.Future] = {}
+        self.__receiver = threading.Thread(target=self.receive, name=f"session-shard-{index}", daemon=True)
+        self.__receiver.start()
+
+    async def call(self, command: str, name: str, *args):
+        """Run a command on a session of the worker and wait for its result, exceptions are raised again here"""
+        call_id = next(self.__call_ids)
+        future = self.loop.create_future()
+        self.__calls[call_id] = future
+
+        self.connection.send((call_id, command, name, args))
+        return await future
+
+    def send(self, command: str, name: str, *args) -> None:
+        """Run a command on a session of the worker without waiting for it"""
+        self.connection.send((None, command, name, args))
+
+    def receive(self) -> None:
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            self.loop.call_soon_threadsafe(self.handle_message, message)
+
+        self.loop.call_soon_threadsafe(self.fail_calls)
+
+    def handle_message(self, message: tuple) -> None:
+        if message[0] == "message":
+            _, name, text = message
+            if name in self.sessions:
+                asyncio.create_task(self.sessions[name].send_message(text))
+            return
+
+        call_id, result, error = message
+        future = self.__calls.pop(call_id)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def fail_calls(self) -> None:
+        """Fail the calls that are still waiting when the worker stopped"""
+        for future in self.__calls.values():
+            if not future.done():
+                future.set_exception(ValueError(f"Session worker {self.index} stopped"))
+        self.__calls.clear()
+
+    def shutdown(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import signal
+from multiprocessing.connection import Connection
+
+from backend.app.services.Metrics import metrics
+from backend.app.services.PlanningExecutor import PlanningExecutor
+from backend.app.services.PoseRing import PoseRing
+from backend.app.services.RobotSession import RobotSession
+from backend.app.services.tools.LoggingHelper import configure_logging
+from backend.app.views.RobotTask import RobotTask
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerRobotSession(RobotSession):
+    """A robot session simulated in a worker process, its poses are written into a shared-memory ring"""
+
+    def __init__(self, name: str, shared: bool, executor: PlanningExecutor, recordings_path: str, ring: PoseRing,
+                 connection: Connection):
+        super().__init__(name, shared, executor, recordings_path)
+        self.ring = ring
+        self.connection = connection
+
+    def publish(self, pose_data: dict) -> None:
+        self.ring.write(pose_data, self.robot.origin_t_1, self.robot.act_states_t_1)
+
+    async def send_message(self, message: str) -> None:
+        # The subscribers are served by the front process
+        self.connection.send(("message", self.name, message))
+
+    def close(self) -> None:
+        super().close()
+        self.ring.close()
+
+
+class SessionWorker(object):
+    """
+    Serving the robot sessions pinned to a worker process, commands are received over a pipe from the front process
+    Every command is answered with its result or exception, unless it is sent without a call id
+    """
+
+    def __init__(self, connection: Connection, recordings_path: str):
+        self.connection = connection
+        self.recordings_path = recordings_path
+        self.executor = PlanningExecutor()
+        self.sessions: dict[str, WorkerRobotSession] = {}
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        tasks = set()
+
+        while True:
+            try:
+                message = await loop.run_in_executor(None, self.connection.recv)
+            except EOFError:
+                break
+            if message is None:
+                break
+
+            # Commands of a session are started in order, they wait for each other on the command lock of the session
+            task = asyncio.create_task(self.handle(*message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        for session in self.sessions.values():
+            session.close()
+        self.executor.shutdown()
+
+    async def handle(self, call_id: int | None, command: str, name: str, args: tuple) -> None:
+        try:
+            result = await self.run_command(command, name, *args)
+            error = None
+        except Exception as e:
+            # Raised again in the front process, as if the session ran there
+            result, error = None, e
+
+        if call_id is None:
+            return
+
+        try:
+            self.connection.send((call_id, result, error))
+        except Exception as e:
+            # A result or exception that cannot be pickled is not sent, the call would then never be answered
+            logger.warning("Could not send the result of %s: %s", command, e)
+            self.connection.send((call_id, None, ValueError(str(e))))
+
+    async def run_command(self, command: str, name: str, *args):
+        match command:
+            case "open":
+                shared, ring_name, ring_capacity = args
+                self.sessions[name] = WorkerRobotSession(name, shared, self.executor, self.recordings_path,
+                                                         PoseRing.attach(ring_name, ring_capacity), self.connection)
+            case "close":
+                self.sessions.pop(name).close()
+            case "move":
+                action, data = args
+                await self.sessions[name].move(RobotTask[action], data)
+            case "stop":
+                await self.sessions[name].stop_motion()
+            case "reset":
+                await self.sessions[name].reset_robot()
+            case "set_streaming_frequency":
+                self.sessions[name].streamer.set_streaming_frequency(*args)
+            case "start_recording":
+                self.sessions[name].start_recording(*args)
+            case "stop_recording":
+                self.sessions[name].stop_recording()
+            case "collect_metrics":
+                return metrics.collect()
+            case _:
+                raise ValueError(f"Unknown command: {command}")
+
+
+def run_session_worker(connection: Connection, recordings_path: str) -> None:
+    """Entry point of a worker process, interrupts are handled by the front process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging()
+    asyncio.run(SessionWorker(connection, recordings_path).serve())
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.FrameScheduler import FrameScheduler
+from backend.app.services.PoseRing import PoseRing
+from backend.app.services.RobotSession import RobotSession, DEFAULT_STREAMING_RATE
+from backend.app.services.SessionShard import SessionShard
+from backend.app.views.RobotTask import RobotTask
+
+
+class ShardedRobotSession(RobotSession):
+    """
+    A robot session simulated by the worker process of its shard, the front process only serves the subscribers
+    Commands are forwarded to the worker, which writes every pose into a shared-memory ring. The latest pose is read
+    from the ring at the streaming frequency and fanned out to the subscribers, and the robot of the session follows it
+    """
+
+    def __init__(self, name: str, shared: bool, shard: SessionShard):
+        super().__init__(name, shared, executor=None)
+        self.shard = shard
+
+        self.ring = PoseRing.create()
+        self.sequence = 0
+        shard.sessions[name] = self
+        shard.send("open", name, shared, self.ring.name, self.ring.capacity)
+
+        self.scheduler = FrameScheduler(DEFAULT_STREAMING_RATE)
+        self.__read_task = asyncio.create_task(self.read_poses())
+
+    def update_streaming_frequency(self) -> None:
+        frequency = max((subscriber.target_rate for subscriber in self.subscribers), default=DEFAULT_STREAMING_RATE)
+        if frequency != self.scheduler.frequency:
+            self.scheduler.set_frequency(frequency)
+            self.shard.send("set_streaming_frequency", self.name, frequency)
+
+    async def read_poses(self) -> None:
+        self.scheduler.start()
+        while True:
+            await self.scheduler.wait_for_next_frame()
+            self.read_latest_pose()
+
+    def read_latest_pose(self) -> None:
+        """Publish the latest pose in the ring when it is new, and move the robot of the session along"""
+        frame = self.ring.read_latest(self.sequence)
+        if frame is None:
+            return
+
+        self.sequence, pose_data, origin, act_states = frame
+        self.robot.set_origin_t_1(origin)
+        self.robot.set_act_states_t_1(act_states)
+        self.robot.origin_t_0 = self.robot.origin_t_1
+        self.robot.act_states_t_0 = self.robot.act_states_t_1
+
+        self.publish(pose_data)
+
+    async def move(self, action: RobotTask, data: json) -> None:
+        await self.shard.call("move", self.name, action.name, data)
+
+    async def stop_motion(self) -> None:
+        await self.shard.call("stop", self.name)
+
+    async def reset_robot(self) -> None:
+        await self.shard.call("reset", self.name)
+
+        # The poses still in the ring are from before the reset
+        self.robot = RobotCrane()
+        self.sequence = self.ring.write_count
+
+    def start_recording(self, path: str) -> None:
+        self.shard.send("start_recording", self.name, path)
+
+    def stop_recording(self) -> None:
+        self.shard.send("stop_recording", self.name)
+
+    def close(self) -> None:
+        self.__read_task.cancel()
+        self.shard.sessions.pop(self.name, None)
+        self.shard.send("close", self.name)
+
+        self.ring.close()
+        self.ring.unlink()
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+from typing import Tuple
+
+import numpy as np
+
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.tools.KinematicsHelper import translate_desired_end_effector_states_for_new_origins, \
+    wrap_angles
+
+logger = logging.getLogger(__name__)
+
+# Version of the way maps are built, a map on disk built another way is rebuilt
+WORKSPACE_MAP_VERSION = 2
+
+
+def erode(mask: np.ndarray, axis: int, periodic: bool = False) -> np.ndarray:
+    """Keep the cells of a mask whose neighbours along the axis are set as well"""
+    previous, following = np.roll(mask, 1, axis=axis), np.roll(mask, -1, axis=axis)
+    if not periodic:
+        edges = [slice(None)] * mask.ndim
+        for edge in (0, -1):
+            edges[axis] = edge
+            previous[tuple(edges)] = following[tuple(edges)] = False
+    return mask & previous & following
+
+
+class WorkspaceMap(object):
+    """
+    Precomputed reachability and manipulability of the robot end effector, on a grid in the robot frame
+    The lift is decoupled from the arm, so the map is stored as a (gripper, x, y, phi) grid for the arm and a (z,)
+    grid for the lift, both memory-mapped from disk. A target is looked up in constant time, at the grid resolution
+    Cells are only reachable when their neighbours are, so a target looked up in a cell on the boundary of the
+    workspace is rather reported out of reach than reachable when the robot cannot reach it
+    """
+
+    def __init__(self, path: str, meta: dict, reachable: np.ndarray, manipulability: np.ndarray,
+                 lift_reachable: np.ndarray):
+        self.path = path
+        self.meta = meta
+        self.reachable = reachable              # (2, x, y, phi) of closed and open gripper
+        self.manipulability = manipulability    # (2, x, y, phi), zero where not reachable
+        self.lift_reachable = lift_reachable    # (z,)
+
+        self.x_min, self.y_min, self.z_min = meta["x_min"], meta["y_min"], meta["z_min"]
+        self.step, self.phi_step = meta["step"], meta["phi_step"]
+
+    @staticmethod
+    def create_meta(robot: RobotCrane, step: float, phi_step: float) -> dict:
+        """Grid of the workspace, covering the full reach of the arm and the stroke of the lift"""
+        dimensions = robot.get_dimensions()
+        reach = dimensions.l_2 + dimensions.l_3 + dimensions.l_5 + dimensions.l_7
+        z_min, z_max = abs(dimensions.d_4) + dimensions.d_4, dimensions.l_1 + dimensions.d_4
+
+        return {"version": WORKSPACE_MAP_VERSION, "dimensions": dimensions.__dict__, "step": step, "phi_step": phi_step,
+                "x_min": -reach, "y_min": -reach, "z_min": z_min - step,
+                "shape": [2, int(np.ceil(2 * reach / step)) + 1, int(np.ceil(2 * reach / step)) + 1,
+                          int(round(2 * np.pi / phi_step))],
+                "z_count": int(np.ceil((z_max - z_min) / step)) + 3}
+
+    @staticmethod
+    def load_or_build(robot: RobotCrane, path: str, step: float = 0.01, phi_step: float = np.deg2rad(5)) \
+            -> 'WorkspaceMap':
+        """Open the map on disk, or build it when there is none for these robot dimensions and resolution"""
+        meta = WorkspaceMap.create_meta(robot, step, phi_step)
+
+        meta_file = os.path.join(path, "workspace.json")
+        if os.path.exists(meta_file):
+            with open(meta_file) as file:
+                if json.load(file) == meta:
+                    return WorkspaceMap(path, meta, np.load(os.path.join(path, "reachable.npy"), mmap_mode='r'),
+                                        np.load(os.path.join(path, "manipulability.npy"), mmap_mode='r'),
+                                        np.load(os.path.join(path, "lift_reachable.npy"), mmap_mode='r'))
+
+        return WorkspaceMap.build(robot, path, meta)
+
+    @staticmethod
+    def build(robot: RobotCrane, path: str, meta: dict) -> 'WorkspaceMap':
+        logger.info("Building workspace map %s in %s", meta["shape"], path)
+        os.makedirs(path, exist_ok=True)
+
+        shape = tuple(meta["shape"])
+        reachable = np.lib.format.open_memmap(os.path.join(path, "reachable.npy"), mode='w+', dtype=bool,
+                                              shape=shape)
+        manipulability = np.lib.format.open_memmap(os.path.join(path, "manipulability.npy"), mode='w+',
+                                                   dtype=np.float32, shape=shape)
+        lift_reachable = np.lib.format.open_memmap(os.path.join(path, "lift_reachable.npy"), mode='w+', dtype=bool,
+                                                   shape=(meta["z_count"],))
+
+        dimensions = robot.get_dimensions()
+        x = meta["x_min"] + meta["step"] * np.arange(shape[1])
+        y = meta["y_min"] + meta["step"] * np.arange(shape[2])
+        x, y = [axis.ravel() for axis in np.meshgrid(x, y, indexing='ij')]
+
+        # Solve the arm at a lift height within its stroke, one phi slice at a time
+        d_1 = (abs(dimensions.d_4) + dimensions.l_1) / 2
+        z = np.full(len(x), d_1 + dimensions.d_4)
+        origin = np.zeros(4)
+
+        for gripper in range(2):
+            for index in range(shape[3]):
+                phi = np.full(len(x), -np.pi + index * meta["phi_step"])
+                targets = np.stack((x, y, z, phi), axis=1)
+                # Solved as the server solves a target, so the map reaches the targets the server accepts
+                act_states, within_limits = robot.inverse_kinematics_batch(targets, origin, bool(gripper))
+
+                reachable[gripper, :, :, index] = within_limits.reshape(shape[1:3])
+                manipulability[gripper, :, :, index] = np.where(
+                    within_limits, np.abs(dimensions.l_2 * dimensions.l_3 * np.sin(act_states[:, 2])), 0.0
+                ).reshape(shape[1:3])
+
+        # Targets are looked up in the nearest cell, which is only reachable when the cells around it are
+        for axis, periodic in ((1, False), (2, False), (3, True)):
+            reachable[:] = erode(reachable, axis, periodic)
+        manipulability[~reachable] = 0.0
+
+        # The lift only depends on the height
+        lift_states = np.zeros((meta["z_count"], 5))
+        lift_states[:, 0] = meta["z_min"] + meta["step"] * np.arange(meta["z_count"]) - dimensions.d_4
+        lift_states[:, 2] = np.pi / 2
+        lift_reachable[:] = erode(robot.validate_act_states_batch(lift_states), 0)
+
+        for array in (reachable, manipulability, lift_reachable):
+            array.flush()
+
+        # The metadata is written last, so an interrupted build is rebuilt on the next start
+        with open(os.path.join(path, "workspace.json"), "w") as file:
+            json.dump(meta, file)
+
+        return WorkspaceMap(path, meta, reachable, manipulability, lift_reachable)
+
+    def query(self, targets: np.ndarray, origin: tuple, do_open_gripper: bool | np.ndarray = True) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Look up an (N, 4) array of (x, y, z, phi) targets, for a robot at the given origin
+        Returns a boolean mask of the reachable targets and their manipulability
+        """
+        targets = translate_desired_end_effector_states_for_new_origins(origin, targets)
+        grippers = np.broadcast_to(np.asarray(do_open_gripper, dtype=int), len(targets))
+
+        x = np.rint((targets[:, 0] - self.x_min) / self.step).astype(int)
+        y = np.rint((targets[:, 1] - self.y_min) / self.step).astype(int)
+        z = np.rint((targets[:, 2] - self.z_min) / self.step).astype(int)
+        phi = np.rint((wrap_angles(targets[:, 3]) + np.pi) / self.phi_step).astype(int) % self.reachable.shape[3]
+
+        inside = ((0 <= x) & (x < self.reachable.shape[1]) & (0 <= y) & (y < self.reachable.shape[2])
+                  & (0 <= z) & (z < len(self.lift_reachable)))
+        x, y, z = np.where(inside, x, 0), np.where(inside, y, 0), np.where(inside, z, 0)
+
+        reachable = inside & self.reachable[grippers, x, y, phi] & self.lift_reachable[z]
+        manipulability = np.where(reachable, self.manipulability[grippers, x, y, phi], 0.0)
+
+        return reachable, manipulability
+
+    def is_reachable(self, x: float, y: float, z: float, phi: float, origin: tuple, do_open_gripper=True) -> bool:
+        reachable, _ = self.query(np.array([[x, y, z, phi]]), origin, do_open_gripper)
+        return bool(reachable[0])
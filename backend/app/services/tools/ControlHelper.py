@@ -0,0 +1,48 @@
+import logging
+from time import perf_counter
+from typing import Tuple
+
+from backend.app.models.OriginTrajectory import OriginTrajectory
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.ControlSimulator import ControlSimulator
+from backend.app.services.Metrics import TRAJECTORY_SAMPLING_SECONDS
+
+# Step in seconds at which controlled moves are simulated, whatever the streaming rate
+# The controllers add their signal on every step, so the dynamics depend on the step as well as on the gains
+CONTROL_TIME_STEP = 1 / 50
+
+logger = logging.getLogger(__name__)
+
+
+def update_robot_with_new_origin_and_control_end_effector(robot: RobotCrane, origin_trajectory: OriginTrajectory,
+                                                          simulator: ControlSimulator,
+                                                          elapsed_time_in_seconds: float) -> bool:
+    # Get the next origin
+    start = perf_counter()
+    next_origin = origin_trajectory.next_step(elapsed_time_in_seconds)
+    TRAJECTORY_SAMPLING_SECONDS.observe(perf_counter() - start)
+    if next_origin is None:
+        logger.debug("No next origin found, end streaming.")
+        return False
+
+    # Update robot actuator states
+    robot = simulator.next_step(robot, elapsed_time_in_seconds, next_origin)
+    if robot is None:
+        logger.debug("No next step found, end streaming.")
+        return False
+
+    return True
+
+
+def plan_origin_control(robot: RobotCrane, gains: dict = None) -> Tuple[OriginTrajectory, ControlSimulator]:
+    """Plan the move to the new origin of the robot, while controlling the end effector at its current position"""
+    # Fetch the new origin
+    new_org = robot.origin_t_1
+
+    # Reset the robot origin
+    robot.set_origin_t_1(robot.origin_t_0)
+
+    org_traj = OriginTrajectory(robot.origin_t_0, new_org)
+    simulator = ControlSimulator(org_traj.get_moving_time(), robot, gains)
+
+    return org_traj, simulator
@@ -1,11 +1,13 @@
+import logging
 from typing import Tuple
 
 import numpy as np
 from math import sin as s, cos as c
-from numpy.linalg import inv
 
 from backend.app.models.ActuatorStates import ActuatorStates
 
+logger = logging.getLogger(__name__)
+
 
 def calculate_dh_parameters(l_2: float, l_3: float, d_4: float, l_5: float,
                             act_states_t_1: ActuatorStates) -> np.ndarray:
@@ -41,7 +43,7 @@ def calculate_transformation_matrices(dh: np.ndarray, t_origin: np.ndarray) -> n
     axis_count = len(dh)
 
     t_matrices = np.zeros((axis_count + 1, 4, 4))
-    t_matrices[0] = inv(t_origin)
+    t_matrices[0] = invert_origin_translation_matrices(t_origin)
 
     for axis in range(axis_count):
         t_matrices[axis + 1] = trans_matrix_from_dh(dh[axis])
@@ -72,6 +74,81 @@ def calculate_origin_translation_matrix(origin: tuple) -> np.ndarray:
     )
 
 
+def invert_origin_translation_matrices(t_origin: np.ndarray) -> np.ndarray:
+    """Invert one or more origin translation matrices in closed form, the rotation is about the z-axis only"""
+    rot = t_origin[..., 0:2, 0:2]
+    trans = t_origin[..., 0:3, 3]
+
+    t_inv = np.zeros(t_origin.shape)
+    t_inv[..., 0:2, 0:2] = np.swapaxes(rot, -1, -2)
+    t_inv[..., 0, 3] = -(rot[..., 0, 0] * trans[..., 0] + rot[..., 1, 0] * trans[..., 1])
+    t_inv[..., 1, 3] = -(rot[..., 0, 1] * trans[..., 0] + rot[..., 1, 1] * trans[..., 1])
+    t_inv[..., 2, 2] = 1.
+    t_inv[..., 2, 3] = -trans[..., 2]
+    t_inv[..., 3, 3] = 1.
+    return t_inv
+
+
+def calculate_dh_parameters_batch(l_2: float, l_3: float, d_4: float, l_5: float,
+                                  act_states: np.ndarray) -> np.ndarray:
+    """Calculate the Denavit-Hartenberg parameters for an (N, 5) array of actuator states, returns (N, 6, 4)"""
+    act_states = np.asarray(act_states, dtype=float).reshape(-1, 5)
+    dh = np.zeros((len(act_states), 6, 4))
+    dh[:, 0, 0] = act_states[:, 0]  # lift
+    dh[:, 1, 1], dh[:, 1, 3] = l_2, act_states[:, 1]  # swing rotation and upper arm
+    dh[:, 2, 1], dh[:, 2, 3] = l_3, act_states[:, 2]  # elbow rotation and lower arm
+    dh[:, 3, 0], dh[:, 3, 3] = d_4, act_states[:, 3]  # wrist rotation and wrist extension
+    dh[:, 4, 1] = l_5  # fixed jaw
+    dh[:, 5, 1] = act_states[:, 4]  # gripper
+    return dh
+
+
+def trans_matrices_from_dh_batch(dh: np.ndarray) -> np.ndarray:
+    """Calculate transformation matrices for an (..., 4) array of DH parameters, returns (..., 4, 4)"""
+    d, a, alpha, theta = dh[..., 0], dh[..., 1], dh[..., 2], dh[..., 3]
+    c_t, s_t, c_a, s_a = np.cos(theta), np.sin(theta), np.cos(alpha), np.sin(alpha)
+
+    t_matrices = np.zeros(dh.shape[:-1] + (4, 4))
+    t_matrices[..., 0, 0], t_matrices[..., 0, 1], t_matrices[..., 0, 2], t_matrices[..., 0, 3] = \
+        c_t, -s_t * c_a, s_t * s_a, a * c_t
+    t_matrices[..., 1, 0], t_matrices[..., 1, 1], t_matrices[..., 1, 2], t_matrices[..., 1, 3] = \
+        s_t, c_t * c_a, -c_t * s_a, a * s_t
+    t_matrices[..., 2, 1], t_matrices[..., 2, 2], t_matrices[..., 2, 3] = s_a, c_a, d
+    t_matrices[..., 3, 3] = 1.
+    return t_matrices
+
+
+def calculate_origin_translation_matrices_batch(origins: np.ndarray) -> np.ndarray:
+    """Calculate the translation matrices for an (N, 4) array of origins, returns (N, 4, 4)"""
+    origins = np.asarray(origins, dtype=float).reshape(-1, 4)
+    c_phi, s_phi = np.cos(origins[:, 3]), np.sin(origins[:, 3])
+
+    t_origin = np.zeros((len(origins), 4, 4))
+    t_origin[:, 0, 0], t_origin[:, 0, 1], t_origin[:, 0, 3] = c_phi, s_phi, -origins[:, 0]
+    t_origin[:, 1, 0], t_origin[:, 1, 1], t_origin[:, 1, 3] = -s_phi, c_phi, -origins[:, 1]
+    t_origin[:, 2, 2], t_origin[:, 2, 3] = 1., -origins[:, 2]
+    t_origin[:, 3, 3] = 1.
+    return t_origin
+
+
+def calculate_state_frames_batch(l_2: float, l_3: float, d_4: float, l_5: float,
+                                 act_states: np.ndarray, origins: np.ndarray) -> np.ndarray:
+    """
+    Calculate the robot state frames for many poses at once
+    Takes an (N, 5) array of actuator states and an (N, 4) array of origins and returns (N, 7, 4, 4) frames
+    """
+    act_states = np.asarray(act_states, dtype=float).reshape(-1, 5)
+    origins = np.broadcast_to(np.asarray(origins, dtype=float).reshape(-1, 4), (len(act_states), 4))
+
+    t_axes = trans_matrices_from_dh_batch(calculate_dh_parameters_batch(l_2, l_3, d_4, l_5, act_states))
+
+    fs = np.empty((len(act_states), t_axes.shape[1] + 1, 4, 4))
+    fs[:, 0] = invert_origin_translation_matrices(calculate_origin_translation_matrices_batch(origins))
+    for axis in range(t_axes.shape[1]):
+        fs[:, axis + 1] = np.matmul(fs[:, axis], t_axes[:, axis])
+    return fs
+
+
 def translate_desired_end_effector_state_for_new_origin(T_origin: np.ndarray, origin_t_1: tuple, phi: float, x: float,
                                                         y: float, z: float) -> Tuple[float, float, float, float]:
     """Calculate an end-effector desired state wrt to a new origin"""
@@ -82,6 +159,45 @@ def translate_desired_end_effector_state_for_new_origin(T_origin: np.ndarray, or
     return phi, x, y, z
 
 
+def translate_desired_end_effector_states_for_new_origins(origins: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Calculate (N, 4) end-effector desired states (x, y, z, phi) wrt to an (N, 4) array of new origins"""
+    targets = np.asarray(targets, dtype=float).reshape(-1, 4)
+    origins = np.broadcast_to(np.asarray(origins, dtype=float).reshape(-1, 4), targets.shape)
+
+    t_origin = calculate_origin_translation_matrices_batch(origins)
+    goals = np.concatenate((targets[:, 0:3], np.ones((len(targets), 1))), axis=1)
+
+    translated = np.empty(targets.shape)
+    translated[:, 0:3] = np.einsum('nij,nj->ni', t_origin, goals)[:, 0:3]
+    translated[:, 3] = targets[:, 3] - origins[:, 3]
+    return translated
+
+
+def calculate_inverse_kinematics_batch(l_2: float, l_3: float, d_4: float, l_5: float, do_open_gripper: bool,
+                                       phi: np.ndarray, x: np.ndarray, y: np.ndarray, z: np.ndarray,
+                                       elbow_up: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Inverse kinematics for arrays of targets
+    Returns an (N, 5) array of actuator states and a boolean mask of the reachable targets,
+    the actuator states of unreachable targets are NaN
+    """
+    phi, x, y, z = np.broadcast_arrays(*(np.asarray(v, dtype=float).ravel() for v in (phi, x, y, z)))
+    l_6 = calculate_jaw_opening(do_open_gripper)
+
+    g_x, g_y = calculate_gripper_position(l_6, phi, x, y)
+    w_x, w_y = calculate_wrist_position(l_5, phi, g_x, g_y)
+
+    theta_2, reachable = calculate_elbow_rotation_batch(l_2, l_3, w_x, w_y, elbow_up)
+    theta_1 = calculate_swing_rotation(l_2, l_3, theta_2, w_x, w_y)
+    theta_3 = calculate_wrist_rotation(phi, theta_1, theta_2)
+
+    d_1 = calculate_lift_position(d_4, z)
+
+    act_states = np.stack((d_1, theta_1, theta_2, theta_3, np.full(len(phi), l_6)), axis=1)
+    act_states[~reachable] = np.nan
+    return act_states, reachable
+
+
 def calculate_inverse_kinematics(l_2: float, l_3: float, d_4: float, l_5: float, do_open_gripper: bool, phi: float,
                                  x: float, y: float, z: float) -> Tuple[float, float, float, float, float]:
     l_6 = calculate_jaw_opening(do_open_gripper)
@@ -116,7 +232,7 @@ def calculate_elbow_rotation(l_2: float, l_3: float, w_x: float, w_y: float) ->
     c_2 = (w_x ** 2 + w_y ** 2 - l_2 ** 2 - l_3 ** 2) / (2 * l_2 * l_3)
 
     if c_2 > 1:
-        print(f"Cos of theta 2 is {c_2}, while it cannot be larger than 1")
+        logger.debug("Cos of theta 2 is %s, while it cannot be larger than 1", c_2)
         raise ValueError("Given end-effector position is out of reach")
 
     # Other solution: - np.sqrt(1 - c_2 ** 2)
@@ -124,6 +240,19 @@ def calculate_elbow_rotation(l_2: float, l_3: float, w_x: float, w_y: float) ->
     return np.arctan2(s_2, c_2)
 
 
+def calculate_elbow_rotation_batch(l_2: float, l_3: float, w_x: np.ndarray, w_y: np.ndarray,
+                                   elbow_up: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculate the elbow rotations for arrays of wrist positions, including a mask of the reachable positions"""
+    c_2 = (w_x ** 2 + w_y ** 2 - l_2 ** 2 - l_3 ** 2) / (2 * l_2 * l_3)
+    reachable = np.abs(c_2) <= 1
+
+    c_2 = np.clip(c_2, -1, 1)
+    s_2 = np.sqrt(1 - c_2 ** 2)
+    if not elbow_up:
+        s_2 = -s_2
+    return np.arctan2(s_2, c_2), reachable
+
+
 def calculate_swing_rotation(l_2: float, l_3: float, theta_2: float, w_x: float, w_y: float) -> float:
     k_1 = l_2 + l_3 * (np.cos(theta_2))
     k_2 = l_3 * (np.sin(theta_2))
@@ -142,3 +271,8 @@ def calculate_wrist_position(l_5: float, phi: float, g_x: float, g_y: float) ->
 
 def calculate_lift_position(d_4: float, z: float) -> float:
     return z - d_4
+
+
+def wrap_angles(angles: np.ndarray) -> np.ndarray:
+    """Wrap angles to [-180, 180) degrees"""
+    return (angles + np.pi) % (2 * np.pi) - np.pi
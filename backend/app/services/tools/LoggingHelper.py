@@ -0,0 +1,50 @@
+import logging
+import os
+import threading
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through a burst of records per message per interval, and drop the rest
+    The first record of the next interval tells how many similar records were dropped. Records are grouped by their
+    logger, level and unformatted message, so messages should pass their values as arguments
+    """
+
+    def __init__(self, interval: float = 10.0, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+
+        # Start, passed records and dropped records of the current interval per message
+        self.windows: dict[tuple, list] = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, record.msg)
+        with self.__lock:
+            window = self.windows.get(key)
+            if window is None or record.created - window[0] >= self.interval:
+                dropped = window[2] if window is not None else 0
+                self.windows[key] = [record.created, 1, 0]
+                if dropped:
+                    record.msg = f"{record.msg} (dropped {dropped} similar messages)"
+                return True
+
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+
+            window[2] += 1
+            return False
+
+
+def configure_logging(level: str = None) -> None:
+    """Log the backend to stderr at the given level, or the ROBOTCRANE_LOG_LEVEL setting, with repeats rate limited"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(RateLimitFilter())
+
+    logger = logging.getLogger("backend")
+    logger.handlers = [handler]
+    logger.setLevel((level or os.environ.get("ROBOTCRANE_LOG_LEVEL", "INFO")).upper())
+    logger.propagate = False
@@ -0,0 +1,40 @@
+from time import perf_counter
+
+import numpy as np
+
+from backend.app.models.LinearTrajectory import LinearTrajectory
+from backend.app.models.OriginTrajectory import OriginTrajectory
+from backend.app.models.PathTrajectory import PathTrajectory
+from backend.app.models.PoseBuffer import PoseBuffer
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.models.Trajectory import Trajectory
+from backend.app.services.Metrics import TRAJECTORY_SAMPLING_SECONDS
+
+
+def calculate_sample_times(moving_time: float, frequency: float) -> np.ndarray:
+    """Calculate the sample times of a motion at the given frequency, always including the end of the motion"""
+    return np.append(np.arange(0, moving_time, 1 / frequency), moving_time)
+
+
+def precompute_trajectory(robot: RobotCrane, trajectory: Trajectory | PathTrajectory | LinearTrajectory,
+                          frequency: float, origin_trajectory: OriginTrajectory = None) -> PoseBuffer:
+    """Precompute all the frames of a trajectory, optionally combined with an origin trajectory"""
+    times = calculate_sample_times(trajectory.get_moving_time(), frequency)
+
+    start = perf_counter()
+    positions, velocities, accelerations = trajectory.sample(times)
+
+    if origin_trajectory is None:
+        origins = np.tile(np.asarray(robot.origin_t_1, dtype=float), (len(times), 1))
+    else:
+        origins, _, _ = origin_trajectory.sample(np.minimum(times, origin_trajectory.get_moving_time()))
+    TRAJECTORY_SAMPLING_SECONDS.observe_batch(perf_counter() - start, len(times))
+
+    if not robot.validate_act_states_batch(positions).all():
+        raise ValueError("Position out of reach: trajectory exceeds the actuator limits")
+    if not robot.validate_velocities_accelerations_batch(velocities, accelerations).all():
+        raise ValueError("Trajectory exceeds the max velocity or acceleration of the actuators")
+
+    frames = robot.get_frames_batch(positions, origins)
+
+    return PoseBuffer(times, positions, velocities, accelerations, origins, frames)
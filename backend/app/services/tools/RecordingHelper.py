@@ -0,0 +1,53 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from backend.app.models.RecordedMotion import RecordedMotion
+from backend.app.services.MotionRecorder import CHANNELS, find_recording, read_index
+
+
+def open_recorded_motion(recordings_path: str, replay_json: json) -> RecordedMotion:
+    return RecordedMotion(find_recording(recordings_path, replay_json["name"]), int(replay_json.get("motion", 0)))
+
+
+def get_channel_size(path: str, channel: str) -> int:
+    """Get the size in bytes of the frames of a channel that are in the index of the recording"""
+    if channel not in CHANNELS:
+        raise ValueError(f"Unknown channel: {channel}")
+
+    index = read_index(path)
+    return index["frame_count"] * int(np.prod(index["channels"][channel], dtype=int)) * np.dtype(index["dtype"]).itemsize
+
+
+def parse_byte_range(range_header: str, size: int) -> tuple[int, int]:
+    """Parse a single HTTP byte range, returns the first and last byte"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        raise ValueError(f"Invalid range: {range_header}")
+
+    if match.group(1) == "":
+        # Suffix range, the last bytes of the file
+        first, last = max(size - int(match.group(2)), 0), size - 1
+    else:
+        first = int(match.group(1))
+        last = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+
+    if first > last or first >= size:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+
+    return first, last
+
+
+def iter_channel_bytes(path: str, channel: str, first: int, last: int, chunk_size: int = 64 * 1024):
+    """Read the bytes from first to last of a channel in chunks, so a channel is never loaded into memory at once"""
+    with open(os.path.join(path, f"{channel}.f64"), "rb") as file:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -2,8 +2,10 @@ import json
 import numpy as np
 
 from backend.app.models.ActuatorStates import ActuatorStates
+from backend.app.models.LinearTrajectory import LinearTrajectory
 from backend.app.models.Pose import Pose
 from backend.app.models.RobotCrane import RobotCrane
+from backend.app.services.WorkspaceMap import WorkspaceMap
 
 
 def initialize_robot(robot: RobotCrane) -> dict:
@@ -18,6 +20,17 @@ def get_pose(robot: RobotCrane) -> dict:
     return {"pose_data": pose.__dict__}
 
 
+def check_reachability(workspace_map: WorkspaceMap, robot: RobotCrane, targets_json: json) -> dict:
+    """Look up whether the end-effector targets are reachable from the current origin of the robot"""
+    targets = [convert_json_to_end_effector_position(target) for target in targets_json["targets"]]
+    do_open_gripper = [bool(target["doOpenGripper"]) for target in targets_json["targets"]]
+
+    reachable, manipulability = workspace_map.query(np.array(targets).reshape(-1, 4), robot.origin_t_1,
+                                                    np.array(do_open_gripper, dtype=bool))
+
+    return {"reachability_data": {"reachable": reachable.tolist(), "manipulability": manipulability.tolist()}}
+
+
 def set_actuator_states(robot: RobotCrane, states: json) -> None:
     act_states = convert_json_to_actuator_states(states)
     robot.set_act_states_t_1(act_states)
@@ -43,6 +56,37 @@ def set_end_effectors(robot: RobotCrane, desired_position: json) -> None:
     robot.set_act_states_t_1(actuator_states)
 
 
+def set_end_effector_linear(robot: RobotCrane, desired_position: json) -> LinearTrajectory:
+    """Plan a straight line of the end effector, the actuator states at the end of the line become the target"""
+    pose = convert_json_to_end_effector_position(desired_position)
+    do_open_gripper = bool(desired_position["doOpenGripper"])
+
+    trajectory = LinearTrajectory(robot, pose, do_open_gripper)
+    robot.set_act_states_t_1(trajectory.act_states_t_1)
+    return trajectory
+
+
+def set_path(robot: RobotCrane, path_json: json) -> list[ActuatorStates]:
+    """Convert the joint or end-effector waypoints of a path, the last waypoint becomes the target of the robot"""
+    waypoints = [convert_json_to_waypoint(robot, waypoint) for waypoint in path_json["waypoints"]]
+    if not waypoints:
+        raise ValueError("A path needs at least one waypoint")
+
+    robot.set_act_states_t_1(waypoints[-1])
+    return waypoints
+
+
+def convert_json_to_waypoint(robot: RobotCrane, waypoint_json: json) -> ActuatorStates:
+    if "x" in waypoint_json:
+        x, y, z, phi = convert_json_to_end_effector_position(waypoint_json)
+        act_states = robot.inverse_kinematics(x, y, z, phi, bool(waypoint_json["doOpenGripper"]))
+    else:
+        act_states = convert_json_to_actuator_states(waypoint_json)
+
+    robot.validate_act_states(act_states)
+    return act_states
+
+
 def set_new_origin(robot: RobotCrane, desired_origin_position: json) -> None:
     x, y, z, phi = convert_json_to_end_effector_position(desired_origin_position)
 
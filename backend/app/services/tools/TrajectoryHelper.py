@@ -10,26 +10,65 @@ def calculate_minimum_move_time(max_velocity: float, max_acceleration: float, t0
     return max(t_based_on_max_v, t_based_on_max_a)
 
 
+def calculate_minimum_move_times(max_velocity: float, max_acceleration: float, t0: np.ndarray,
+                                 t1: np.ndarray) -> np.ndarray:
+    """Calculate minimum moving times for arrays of start and end positions"""
+    t_based_on_max_v = 3 * (np.abs(t1 - t0)) / (2 * max_velocity)
+    t_based_on_max_a = np.sqrt((6 * np.abs(t1 - t0)) / max_acceleration)
+    return np.maximum(t_based_on_max_v, t_based_on_max_a)
+
+
 def get_coefficients_nonzero_v_and_a(t0: float, t1: float, v0: float, t_end: float, v1: float = 0) \
         -> Tuple[float, float, float, float]:
-    """Retrieve trajectory formula coefficients (assuming velocity at end point is zero"""
+    """Retrieve trajectory formula coefficients (assuming velocity at end point is zero, unless given)"""
     a_0 = t0
     a_1 = v0
     a_2 = (3 / t_end ** 2) * (t1 - t0) - (2 / t_end) * v0 - (1 / t_end) * v1
-    a_3 = -(2 / t_end ** 3) * (t1 - t0) + (1 / t_end ** 2) * (v1 - v0)
+    a_3 = -(2 / t_end ** 3) * (t1 - t0) + (1 / t_end ** 2) * (v0 + v1)
 
     return a_0, a_1, a_2, a_3
 
 
+def get_coefficients_array(t0: np.ndarray, t1: np.ndarray, v0: np.ndarray, t_end: float | np.ndarray,
+                           v1: np.ndarray = 0.0) -> np.ndarray:
+    """
+    Retrieve the trajectory formula coefficients for arrays of joints, with the coefficients on the last axis
+    The moving time is a scalar, or an array that broadcasts against the joints, e.g. (robots, 1) for (robots, joints)
+    """
+    t0, t1, v0 = np.asarray(t0, dtype=float), np.asarray(t1, dtype=float), np.asarray(v0, dtype=float)
+    t_end = np.asarray(t_end, dtype=float)
+
+    # Without moving time the joints stay at their start position
+    moving = t_end > 0
+    a_0, a_1, a_2, a_3 = get_coefficients_nonzero_v_and_a(t0, t1, v0, np.where(moving, t_end, 1.0), v1)
+
+    shape = np.broadcast(t0, t_end).shape
+    return np.stack((np.broadcast_to(a_0, shape), np.where(moving, a_1, 0.0), np.where(moving, a_2, 0.0),
+                     np.where(moving, a_3, 0.0)), axis=-1)
+
+
 def calculate_position_velocity_acceleration(a_0: float, a_1: float, a_2: float, a_3: float, t: float) -> \
         Tuple[float, float, float]:
     position = calculate_position(a_0, a_1, a_2, a_3, t)
-    velocity = calculate_velocity(a_0, a_1, a_2, t)
-    acceleration = calculate_acceleration(a_0, a_1, t)
+    velocity = calculate_velocity(a_1, a_2, a_3, t)
+    acceleration = calculate_acceleration(a_2, a_3, t)
 
     return position, velocity, acceleration
 
 
+def calculate_positions_velocities_accelerations(coefficients: np.ndarray, times: np.ndarray) -> \
+        Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Calculate position, velocity and acceleration of (joints, 4) coefficients at all times, each (times, joints)"""
+    t = np.asarray(times, dtype=float).reshape(-1, 1)
+    a_0, a_1, a_2, a_3 = coefficients[:, 0], coefficients[:, 1], coefficients[:, 2], coefficients[:, 3]
+
+    positions = calculate_position(a_0, a_1, a_2, a_3, t)
+    velocities = calculate_velocity(a_1, a_2, a_3, t)
+    accelerations = calculate_acceleration(a_2, a_3, t)
+
+    return positions, velocities, accelerations
+
+
 def calculate_position(a_0: float, a_1: float, a_2: float, a_3: float, t: float) -> float:
     """Calculate position at time t"""
     return a_0 + a_1 * t + a_2 * t ** 2 + a_3 * t ** 3
@@ -43,3 +82,39 @@ def calculate_velocity(a_1: float, a_2: float, a_3: float, t: float) -> float:
 def calculate_acceleration(a_2, a_3, t) -> float:
     """Calculate acceleration at time t"""
     return 2 * a_2 + 6 * a_3 * t
+
+
+def calculate_via_velocities(positions: np.ndarray, durations: np.ndarray, start_velocities: np.ndarray) -> np.ndarray:
+    """
+    Calculate the velocities at (waypoints, joints) positions, for segments with the given durations
+    A joint passes an intermediate waypoint with the mean velocity of the adjacent segments, or stops there when it
+    changes direction. The path ends at rest
+    """
+    slopes = np.diff(positions, axis=0) / durations[:, np.newaxis]
+
+    velocities = np.zeros(positions.shape)
+    velocities[0] = start_velocities
+    velocities[1:-1] = np.where(np.sign(slopes[:-1]) == np.sign(slopes[1:]), (slopes[:-1] + slopes[1:]) / 2, 0.0)
+
+    return velocities
+
+
+def calculate_peak_velocities_accelerations(coefficients: np.ndarray, durations: np.ndarray) -> \
+        Tuple[np.ndarray, np.ndarray]:
+    """Calculate the largest absolute velocity and acceleration of (segments, joints, 4) coefficients"""
+    a_1, a_2, a_3 = coefficients[..., 1], coefficients[..., 2], coefficients[..., 3]
+    t_end = durations[:, np.newaxis]
+
+    # The velocity peaks at the end points, or where the acceleration is zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_peak = np.clip(np.where(a_3 != 0, -a_2 / (3 * a_3), 0.0), 0, t_end)
+
+    peak_velocities = np.maximum.reduce([np.abs(calculate_velocity(a_1, a_2, a_3, 0.0)),
+                                         np.abs(calculate_velocity(a_1, a_2, a_3, t_end)),
+                                         np.abs(calculate_velocity(a_1, a_2, a_3, t_peak))])
+
+    # The acceleration is linear, so it peaks at the end points
+    peak_accelerations = np.maximum(np.abs(calculate_acceleration(a_2, a_3, 0.0)),
+                                    np.abs(calculate_acceleration(a_2, a_3, t_end)))
+
+    return peak_velocities, peak_accelerations
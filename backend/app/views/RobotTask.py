@@ -5,7 +5,14 @@ class RobotTask(Enum):
     initialize_robot = 'initialize_robot'
     reset_robot = 'reset_robot'
     get_pose = 'get_pose'
+    check_reachability = 'check_reachability'
     move_actuators = 'move_actuators'
     move_end_effector = 'move_end_effector'
+    move_end_effector_linear = 'move_end_effector_linear'
+    move_path = 'move_path'
     move_origin = 'move_origin'
     move_origin_control_end_effector = 'move_origin_control_end_effector'
+    stop = 'stop'
+    start_recording = 'start_recording'
+    stop_recording = 'stop_recording'
+    replay = 'replay'
@@ -1,8 +1,11 @@
 import json
+import logging
 
 from starlette.websockets import WebSocket
 from typing import List
 
+logger = logging.getLogger(__name__)
+
 
 class WebSocketAPI:
     def __init__(self):
@@ -12,12 +15,12 @@ class WebSocketAPI:
         await websocket.accept()
         self.active_connections.append(websocket)
 
-        print(f"Connected")
+        logger.info("Connected")
 
     def disconnect(self, websocket: WebSocket) -> None:
         self.active_connections.remove(websocket)
 
-        print(f"Disconnected")
+        logger.info("Disconnected")
 
     async def receive_message(self, websocket: WebSocket) -> str:
         return await websocket.receive_text()
@@ -27,3 +30,6 @@ class WebSocketAPI:
 
     async def send_json_message(self, websocket: WebSocket, json_message: json):
         await websocket.send_json(json_message)
+
+    async def send_bytes_message(self, websocket: WebSocket, bytes_message: bytes):
+        await websocket.send_bytes(bytes_message)
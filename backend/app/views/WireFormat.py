@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class WireFormat(Enum):
+    json = 'json'
+    binary = 'binary'
+    delta = 'delta'
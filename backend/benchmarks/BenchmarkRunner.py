@@ -0,0 +1,141 @@
+import gc
+import json
+import platform
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+
+class Benchmark(object):
+    """
+    A benchmarked operation of a given size, e.g. a single call or one call on a batch of poses
+    The operation is created by the setup outside of the measurement, times and allocations are reported per op
+    """
+
+    def __init__(self, name: str, size: int, setup: Callable[[], Callable[[], object]]):
+        self.name = name
+        self.size = size
+        self.setup = setup
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.size}]"
+
+
+class BenchmarkRunner(object):
+    """
+    Measuring the time and allocations of benchmarks
+    The number of loops is calibrated until a repeat takes at least the minimum time, and the fastest repeat is reported,
+    as the slower repeats only add noise of the machine. Garbage collection is disabled while timing. Allocations are
+    measured with tracemalloc in a separate call, as the peak of the traced memory during a single call
+    """
+
+    def __init__(self, min_time: float = 0.1, repeats: int = 5):
+        self.min_time = min_time
+        self.repeats = repeats
+
+    def run(self, benchmarks: list[Benchmark]) -> dict[str, dict]:
+        results = {}
+        for benchmark in benchmarks:
+            results[benchmark.key] = self.measure(benchmark)
+            print(format_result(benchmark.key, results[benchmark.key]))
+        return results
+
+    def measure(self, benchmark: Benchmark) -> dict:
+        operation = benchmark.setup()
+
+        # Warm up caches and lazily initialized state before measuring
+        operation()
+
+        loops = self.calibrate(operation)
+        seconds = min(self.time_loops(operation, loops) for _ in range(self.repeats))
+        peak_bytes, retained_bytes = measure_allocations(operation)
+
+        return {"name": benchmark.name, "size": benchmark.size, "loops": loops, "repeats": self.repeats,
+                "ns_per_op": seconds / loops / benchmark.size * 1e9,
+                "peak_bytes_per_op": peak_bytes / benchmark.size,
+                "retained_bytes": retained_bytes}
+
+    def calibrate(self, operation: Callable[[], object]) -> int:
+        loops = 1
+        while self.time_loops(operation, loops) < self.min_time:
+            loops *= 2
+        return loops
+
+    @staticmethod
+    def time_loops(operation: Callable[[], object], loops: int) -> float:
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(loops):
+                operation()
+            return time.perf_counter() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+
+def measure_allocations(operation: Callable[[], object]) -> tuple[int, int]:
+    """Get the peak traced memory during a call and the memory still allocated after it, in bytes"""
+    tracemalloc.start()
+    try:
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = operation()
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    return peak_bytes - start_bytes, current_bytes - start_bytes
+
+
+def get_machine() -> dict:
+    """Describe the machine and versions the results were measured with, results only compare on the same machine"""
+    return {"platform": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "python": platform.python_version(), "numpy": np.__version__}
+
+
+def save_baseline(path: str, results: dict[str, dict]) -> None:
+    with open(path, "w") as file:
+        json.dump({"machine": get_machine(), "benchmarks": results}, file, indent=2)
+        file.write("\n")
+
+
+def load_baseline(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def find_regressions(results: dict[str, dict], baseline: dict, threshold: float,
+                     bytes_tolerance: float = 64) -> list[str]:
+    """
+    Compare results with a baseline, returns a description of every benchmark that regressed past the threshold
+    Allocations get an absolute tolerance in bytes per op as well, so small buffers do not fail on a few bytes
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline["benchmarks"]:
+            continue
+        base = baseline["benchmarks"][key]
+
+        time_ratio = result["ns_per_op"] / base["ns_per_op"]
+        if time_ratio > 1 + threshold:
+            regressions.append(f"{key}: {result['ns_per_op']:.1f} ns/op is {time_ratio - 1:.0%} slower than the "
+                               f"baseline of {base['ns_per_op']:.1f} ns/op")
+
+        if result["peak_bytes_per_op"] > base["peak_bytes_per_op"] * (1 + threshold) + bytes_tolerance:
+            regressions.append(f"{key}: {result['peak_bytes_per_op']:.0f} bytes/op exceeds the baseline of "
+                               f"{base['peak_bytes_per_op']:.0f} bytes/op")
+
+    return regressions
+
+
+def format_result(key: str, result: dict, base: dict = None) -> str:
+    line = f"{key:<48} {result['ns_per_op']:>12.1f} ns/op {result['peak_bytes_per_op']:>12.0f} bytes/op"
+    if base is not None:
+        line += f" {result['ns_per_op'] / base['ns_per_op'] - 1:>+8.1%}"
+    return line
@@ -0,0 +1,274 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from backend.app.models.ActuatorStates import ActuatorStates
+from backend.app.models.OriginTrajectory import OriginTrajectory
+from backend.app.models.Pose import Pose
+from backend.app.models.RobotCrane import RobotCrane
+from backend.app.models.Trajectory import Trajectory
+from backend.app.services.ControlSimulator import ControlSimulator
+from backend.app.services.FleetSimulator import FleetSimulator
+from backend.app.services.tools.KinematicsHelper import calculate_transformation_matrices, calculate_state_frames, \
+    calculate_inverse_kinematics, calculate_inverse_kinematics_batch, calculate_dh_parameters_batch, \
+    trans_matrices_from_dh_batch, calculate_origin_translation_matrices_batch, invert_origin_translation_matrices, \
+    calculate_state_frames_batch
+from backend.app.services.tools.ControlHelper import CONTROL_TIME_STEP
+from backend.app.services.tools.PlaybackHelper import precompute_trajectory
+from backend.benchmarks.BenchmarkRunner import Benchmark, BenchmarkRunner, save_baseline, load_baseline, \
+    find_regressions, format_result, get_machine
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+BATCH_SIZES = (100, 10_000)
+
+# Every benchmark starts from the same poses, so results only depend on the code and the machine
+START = ActuatorStates(0.7, np.deg2rad(10), np.deg2rad(45), np.deg2rad(-30), 0.1)
+END = ActuatorStates(0.5, np.deg2rad(90), np.deg2rad(-60), np.deg2rad(20), 0.05)
+ORIGIN = (0.1, 0.2, 0.0, np.deg2rad(15))
+NEW_ORIGIN = (0.3, -0.1, 0.0, np.deg2rad(30))
+
+
+def create_robot() -> RobotCrane:
+    robot = RobotCrane()
+    robot.set_origin_t_1(ORIGIN)
+    robot.set_act_states_t_1(ActuatorStates(*START.get_states()))
+    return robot
+
+
+def create_poses(size: int) -> tuple[np.ndarray, np.ndarray]:
+    """Get (size, 5) actuator states and (size, 4) origins, evenly spread between the start and end poses"""
+    fractions = np.linspace(0, 1, size)[:, np.newaxis]
+    act_states = np.asarray(START.get_states()) + fractions * (np.asarray(END.get_states()) -
+                                                               np.asarray(START.get_states()))
+    origins = np.asarray(ORIGIN) + fractions * (np.asarray(NEW_ORIGIN) - np.asarray(ORIGIN))
+    return act_states, origins
+
+
+def create_targets(size: int) -> np.ndarray:
+    """Get (size, 4) reachable end-effector targets"""
+    act_states, _ = create_poses(size)
+    frames = create_robot().get_frames_batch(act_states, np.zeros((size, 4)))
+    phi = act_states[:, 1] + act_states[:, 2] + act_states[:, 3]
+    return np.concatenate((frames[:, -1, 0:3, 3], phi[:, np.newaxis]), axis=1)
+
+
+def setup_transformation_matrices():
+    robot = create_robot()
+    dh, t_origin = robot.denavit_hartenberg_parameters, robot.origin_translation_matrix
+    return lambda: calculate_transformation_matrices(dh, t_origin)
+
+
+def setup_transformation_matrices_batch(size: int):
+    act_states, origins = create_poses(size)
+    dimensions = create_robot().get_dimensions()
+
+    def operation():
+        dh = calculate_dh_parameters_batch(dimensions.l_2, dimensions.l_3, dimensions.d_4, dimensions.l_5, act_states)
+        return trans_matrices_from_dh_batch(dh), \
+            invert_origin_translation_matrices(calculate_origin_translation_matrices_batch(origins))
+
+    return operation
+
+
+def setup_state_frames():
+    robot = create_robot()
+    t_matrices = robot.transformation_matrices
+    return lambda: calculate_state_frames(len(t_matrices) - 1, t_matrices)
+
+
+def setup_state_frames_batch(size: int):
+    act_states, origins = create_poses(size)
+    dimensions = create_robot().get_dimensions()
+    return lambda: calculate_state_frames_batch(dimensions.l_2, dimensions.l_3, dimensions.d_4, dimensions.l_5,
+                                                act_states, origins)
+
+
+def setup_get_frames():
+    robot = create_robot()
+
+    def operation():
+        # Setting the origin invalidates the cached frames
+        robot.set_origin_t_1(ORIGIN)
+        return robot.get_frames()
+
+    return operation
+
+
+def setup_get_frames_cached():
+    robot = create_robot()
+    return robot.get_frames
+
+
+def setup_get_frames_batch(size: int):
+    robot = create_robot()
+    act_states, origins = create_poses(size)
+    return lambda: robot.get_frames_batch(act_states, origins)
+
+
+def setup_inverse_kinematics():
+    dimensions = create_robot().get_dimensions()
+    x, y, z, phi = create_targets(1)[0].tolist()
+    return lambda: calculate_inverse_kinematics(dimensions.l_2, dimensions.l_3, dimensions.d_4, dimensions.l_5, True,
+                                                phi, x, y, z)
+
+
+def setup_inverse_kinematics_batch(size: int):
+    dimensions = create_robot().get_dimensions()
+    x, y, z, phi = create_targets(size).T
+    return lambda: calculate_inverse_kinematics_batch(dimensions.l_2, dimensions.l_3, dimensions.d_4, dimensions.l_5,
+                                                      True, phi, x, y, z)
+
+
+def create_trajectory() -> Trajectory:
+    robot = create_robot()
+    return Trajectory(START, END, robot.max_vel, robot.max_acc, robot.max_ang_vel, robot.max_ang_acc)
+
+
+def setup_trajectory_next_step():
+    trajectory = create_trajectory()
+    t = trajectory.get_moving_time() / 3
+    return lambda: trajectory.calculate_next_step(t)
+
+
+def setup_trajectory_sample(size: int):
+    trajectory = create_trajectory()
+    times = np.linspace(0, trajectory.get_moving_time(), size)
+    return lambda: trajectory.sample(times)
+
+
+def setup_origin_trajectory_next_step():
+    origin_trajectory = OriginTrajectory(ORIGIN, NEW_ORIGIN)
+    t = origin_trajectory.get_moving_time() / 3
+    return lambda: origin_trajectory.calculate_next_step(t)
+
+
+def setup_origin_trajectory_sample(size: int):
+    origin_trajectory = OriginTrajectory(ORIGIN, NEW_ORIGIN)
+    times = np.linspace(0, origin_trajectory.get_moving_time(), size)
+    return lambda: origin_trajectory.sample(times)
+
+
+def get_control_step_times() -> np.ndarray:
+    """Get the steps of an origin move with end-effector control, at the control step of the server"""
+    moving_time = OriginTrajectory(ORIGIN, NEW_ORIGIN).get_moving_time()
+    return np.arange(0, moving_time, CONTROL_TIME_STEP)
+
+
+def setup_control_simulator_next_step():
+    """
+    Simulate a whole origin move with end-effector control per op, reported per step
+    The simulator only runs forward, so every op starts a new move, which is a small part of the steps of the move
+    """
+    times = get_control_step_times().tolist()
+
+    def operation():
+        robot = create_robot()
+        origin_trajectory = OriginTrajectory(ORIGIN, NEW_ORIGIN)
+        simulator = ControlSimulator(origin_trajectory.get_moving_time(), robot)
+        for t in times:
+            simulator.next_step(robot, t, origin_trajectory.calculate_next_step(t))
+        return robot
+
+    return operation
+
+
+def setup_fleet_simulator_step(size: int):
+    fleet = FleetSimulator(size, create_robot())
+    fleet.set_origin_targets(np.arange(size), np.tile(NEW_ORIGIN, (size, 1)), control_end_effector=True)
+    return lambda: fleet.step(1 / 1000)
+
+
+def setup_pose():
+    robot = create_robot()
+    frames = robot.get_frames()
+    return lambda: Pose(frames, robot.origin_t_1, robot.act_states_t_1)
+
+
+def setup_pose_buffer_get_pose_data(size: int):
+    robot = create_robot()
+    trajectory = create_trajectory()
+
+    # Sample the trajectory at the frequency that gives the number of frames
+    pose_buffer = precompute_trajectory(robot, trajectory, (size - 1) / trajectory.get_moving_time())
+    indices = range(min(size, len(pose_buffer)))
+    return lambda: [pose_buffer.get_pose_data(index) for index in indices]
+
+
+def create_benchmarks() -> list[Benchmark]:
+    """Single calls of the hot functions, and their vectorized counterparts at every batch size"""
+    benchmarks = [
+        Benchmark("calculate_transformation_matrices", 1, setup_transformation_matrices),
+        Benchmark("calculate_state_frames", 1, setup_state_frames),
+        Benchmark("RobotCrane.get_frames", 1, setup_get_frames),
+        Benchmark("RobotCrane.get_frames_cached", 1, setup_get_frames_cached),
+        Benchmark("calculate_inverse_kinematics", 1, setup_inverse_kinematics),
+        Benchmark("Trajectory.calculate_next_step", 1, setup_trajectory_next_step),
+        Benchmark("OriginTrajectory.calculate_next_step", 1, setup_origin_trajectory_next_step),
+        Benchmark("ControlSimulator.next_step", len(get_control_step_times()), setup_control_simulator_next_step),
+        Benchmark("Pose", 1, setup_pose),
+    ]
+
+    for size in BATCH_SIZES:
+        benchmarks += [
+            Benchmark("trans_matrices_from_dh_batch", size, lambda size=size: setup_transformation_matrices_batch(size)),
+            Benchmark("calculate_state_frames_batch", size, lambda size=size: setup_state_frames_batch(size)),
+            Benchmark("RobotCrane.get_frames_batch", size, lambda size=size: setup_get_frames_batch(size)),
+            Benchmark("calculate_inverse_kinematics_batch", size,
+                      lambda size=size: setup_inverse_kinematics_batch(size)),
+            Benchmark("Trajectory.sample", size, lambda size=size: setup_trajectory_sample(size)),
+            Benchmark("OriginTrajectory.sample", size, lambda size=size: setup_origin_trajectory_sample(size)),
+            Benchmark("FleetSimulator.step", size, lambda size=size: setup_fleet_simulator_step(size)),
+            Benchmark("PoseBuffer.get_pose_data", size, lambda size=size: setup_pose_buffer_get_pose_data(size)),
+        ]
+
+    return benchmarks
+
+
+def main(arguments: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the kinematics and trajectory hot paths")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file to compare with or save to")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction, e.g. 0.25")
+    parser.add_argument("--filter", default="", help="only run the benchmarks with this text in their name")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimum time of a repeat in seconds")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(arguments)
+
+    benchmarks = [benchmark for benchmark in create_benchmarks() if args.filter in benchmark.key]
+    results = BenchmarkRunner(args.min_time, args.repeats).run(benchmarks)
+
+    if args.save:
+        # A filtered run only replaces its own benchmarks, the others stay in the baseline
+        if args.filter and os.path.exists(args.baseline):
+            baseline = load_baseline(args.baseline)
+            if baseline["machine"] != get_machine():
+                print(f"Merging into a baseline measured on {baseline['machine']}, not on {get_machine()}")
+            results = baseline["benchmarks"] | results
+
+        save_baseline(args.baseline, results)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save to create it")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline["machine"] != get_machine():
+        print(f"Baseline was measured on {baseline['machine']}, not on {get_machine()}")
+
+    print("\nCompared to the baseline:")
+    for key, result in results.items():
+        print(format_result(key, result, baseline["benchmarks"].get(key)))
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
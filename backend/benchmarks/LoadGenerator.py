@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import websockets
+
+# Commands of a scripted mix, with their default weights
+DEFAULT_MIX = {"move_actuators": 1, "move_end_effector": 1, "move_origin": 1, "move_origin_control_end_effector": 1}
+
+
+class LoadClient(object):
+    """
+    A websocket client driving a private robot session with a scripted mix of motion commands
+    Every command is sent once the previous motion stopped streaming, and the arrival time of every frame is kept
+    """
+
+    def __init__(self, index: int, url: str, mix: dict[str, float], rate: float, wire_format: str, seed: int):
+        self.index = index
+        self.url = url
+        self.mix = mix
+        self.rate = rate
+        self.wire_format = wire_format
+        self.random = random.Random(seed + index)
+
+        # The idle gap after which a motion is considered finished, and the time to wait for its first frame
+        self.idle_time = max(0.25, 10 / rate)
+        self.first_frame_timeout = 5.0
+
+        self.origin = (0.0, 0.0, 0.0, 0.0)
+        self.commands = {command: 0 for command in mix}
+        self.latencies: list[float] = []
+        self.intervals: list[float] = []
+        self.motion_times: list[float] = []
+        self.frame_count = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    async def run(self, start_delay: float, deadline: float) -> None:
+        await asyncio.sleep(start_delay)
+
+        async with websockets.connect(self.url, max_size=None) as websocket:
+            await websocket.send(json.dumps({"action": "initialize_robot",
+                                             "data": {"rate": self.rate, "format": self.wire_format}}))
+            init_data = json.loads(await websocket.recv())
+            self.rate = init_data["init_robot_data"]["streaming_rate"]
+
+            while time.perf_counter() < deadline:
+                command, data = self.next_command()
+                self.commands[command] += 1
+
+                sent_time = time.perf_counter()
+                await websocket.send(json.dumps({"action": command, "data": data}))
+                await self.receive_motion(websocket, sent_time)
+
+    async def receive_motion(self, websocket, sent_time: float) -> None:
+        """Receive the frames of a motion until the stream goes idle"""
+        first_frame_time = last_frame_time = None
+
+        while True:
+            timeout = self.first_frame_timeout if last_frame_time is None else self.idle_time
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout)
+            except asyncio.TimeoutError:
+                break
+
+            receive_time = time.perf_counter()
+            if isinstance(message, str) and message.startswith("Invalid request"):
+                self.errors += 1
+                break
+            if isinstance(message, str) and "pose_data" not in message:
+                continue
+
+            self.frame_count += 1
+            if last_frame_time is None:
+                first_frame_time = receive_time
+                self.latencies.append(receive_time - sent_time)
+            else:
+                self.intervals.append(receive_time - last_frame_time)
+            last_frame_time = receive_time
+
+        if first_frame_time is None:
+            self.timeouts += 1
+        else:
+            self.motion_times.append(last_frame_time - first_frame_time)
+
+    def next_command(self) -> tuple[str, dict]:
+        command = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        uniform = self.random.uniform
+
+        match command:
+            case "move_actuators":
+                return command, {"d1": uniform(0.3, 0.9), "theta1": uniform(-90, 90), "theta2": uniform(-120, 120),
+                                 "theta3": uniform(-90, 90), "l6": uniform(0.0, 0.1)}
+
+            case "move_end_effector":
+                # Within reach of the arm around the current origin
+                radius, angle = uniform(0.35, 0.55), uniform(-np.pi, np.pi)
+                return command, {"x": self.origin[0] + radius * np.cos(angle),
+                                 "y": self.origin[1] + radius * np.sin(angle), "z": uniform(0.2, 0.7),
+                                 "phi": uniform(-90, 90), "doOpenGripper": self.random.random() < 0.5}
+
+            case "move_origin" | "move_origin_control_end_effector":
+                self.origin = (uniform(-0.15, 0.15), uniform(-0.15, 0.15), 0.0, uniform(-20, 20))
+                x, y, z, phi = self.origin
+                return command, {"x": x, "y": y, "z": z, "phi": phi}
+
+            case _:
+                raise ValueError(f"Command not supported by the load generator: {command}")
+
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Parse a mix as comma separated command=weight pairs, e.g. move_actuators=2,move_origin=1"""
+    weights = {}
+    for item in mix.split(","):
+        command, _, weight = item.partition("=")
+        if command not in DEFAULT_MIX:
+            raise ValueError(f"Command not supported by the load generator: {command}")
+        weights[command] = float(weight or 1)
+    return weights
+
+
+def get_process_tree(pid: int) -> list[int]:
+    """Get a process and all its descendants, from /proc"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as file:
+                    parents[int(entry)] = int(file.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError):
+                continue
+
+    tree = [pid]
+    for process in tree:
+        tree += [child for child, parent in parents.items() if parent == process]
+    return tree
+
+
+def read_cpu_seconds(pid: int) -> float | None:
+    """Get the user and system CPU time of a process and its descendants, None where /proc is not available"""
+    if not os.path.exists(f"/proc/{pid}/stat"):
+        return None
+
+    ticks = 0
+    for process in get_process_tree(pid):
+        try:
+            with open(f"/proc/{process}/stat") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError):
+            continue
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def start_server(port: int, session_workers: int) -> subprocess.Popen:
+    """Start backend.main:app with uvicorn on localhost and wait until it accepts connections"""
+    # The server logs every connection at INFO, which would flood the report
+    environment = {"ROBOTCRANE_LOG_LEVEL": "WARNING"} | os.environ
+    environment["ROBOTCRANE_SESSION_WORKERS"] = str(session_workers)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                               "--log-level", "warning"], env=environment, stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError("Server did not start within 120 s")
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+async def run_load(clients: list[LoadClient], duration: float, ramp_time: float, server_pid: int = None) -> dict:
+    """Run all clients for the duration and report on the frames they received"""
+    start_time = time.perf_counter()
+    cpu_start = read_cpu_seconds(server_pid) if server_pid is not None else None
+
+    deadline = start_time + ramp_time + duration
+    results = await asyncio.gather(*(client.run(ramp_time * client.index / len(clients), deadline)
+                                     for client in clients), return_exceptions=True)
+
+    elapsed = time.perf_counter() - start_time
+    cpu_end = read_cpu_seconds(server_pid) if server_pid is not None else None
+
+    report = create_report(clients, elapsed)
+    report["failed_clients"] = [f"{client.index}: {result!r}" for client, result in zip(clients, results)
+                                if isinstance(result, BaseException)]
+    if cpu_start is not None and cpu_end is not None:
+        report["server_cpu"] = (cpu_end - cpu_start) / elapsed
+        report["server_cpu_per_session"] = report["server_cpu"] / len(clients)
+    return report
+
+
+def create_report(clients: list[LoadClient], elapsed: float) -> dict:
+    latencies = [latency for client in clients for latency in client.latencies]
+    intervals = [interval for client in clients for interval in client.intervals]
+    rate = clients[0].rate
+    jitter = [abs(interval - 1 / rate) for interval in intervals]
+
+    # Frame rate while streaming motions, per client
+    frame_rates = [len(client.intervals) / sum(client.motion_times) for client in clients if sum(client.motion_times)]
+
+    commands = {}
+    for client in clients:
+        for command, count in client.commands.items():
+            commands[command] = commands.get(command, 0) + count
+
+    return {
+        "clients": len(clients), "elapsed_s": elapsed, "requested_rate": rate, "commands": commands,
+        "frames": sum(client.frame_count for client in clients),
+        "errors": sum(client.errors for client in clients),
+        "timeouts": sum(client.timeouts for client in clients),
+        "frame_rate_mean": float(np.mean(frame_rates)) if frame_rates else float("nan"),
+        "frame_rate_min": float(np.min(frame_rates)) if frame_rates else float("nan"),
+        "late_frames": float(np.mean(np.array(intervals) > 1.5 / rate)) if intervals else float("nan"),
+        "jitter_p50_ms": percentile(jitter, 50) * 1000, "jitter_p99_ms": percentile(jitter, 99) * 1000,
+        "latency_p50_ms": percentile(latencies, 50) * 1000, "latency_p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Clients: {report['clients']} over {report['elapsed_s']:.1f} s, commands: {report['commands']}",
+        f"Frames: {report['frames']}, errors: {report['errors']}, motions without frames: {report['timeouts']}",
+        f"Frame rate: mean {report['frame_rate_mean']:.1f} fps, slowest client {report['frame_rate_min']:.1f} fps, "
+        f"requested {report['requested_rate']:.0f} fps",
+        f"Inter-frame jitter: p50 {report['jitter_p50_ms']:.2f} ms, p99 {report['jitter_p99_ms']:.2f} ms, "
+        f"late frames (> 1.5 period): {report['late_frames']:.1%}",
+        f"Command to first frame: p50 {report['latency_p50_ms']:.1f} ms, p99 {report['latency_p99_ms']:.1f} ms",
+    ]
+    if "server_cpu" in report:
+        lines.append(f"Server CPU: {report['server_cpu']:.1%} of a core, "
+                     f"{report['server_cpu_per_session']:.2%} of a core per session")
+    for failure in report["failed_clients"]:
+        lines.append(f"Client failed: {failure}")
+    return "\n".join(lines)
+
+
+def main(arguments: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Load the robot crane websocket with concurrent sessions")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load after the ramp")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which the clients connect")
+    parser.add_argument("--mix", default=",".join(DEFAULT_MIX), help="command=weight pairs, e.g. move_origin=2")
+    parser.add_argument("--rate", type=float, default=50, help="streaming rate requested by every client")
+    parser.add_argument("--format", default="json", help="wire format requested by every client")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="websocket of a running server, e.g. ws://127.0.0.1:8080/robotcrane")
+    parser.add_argument("--server-pid", type=int, help="process of the running server, to measure its CPU")
+    parser.add_argument("--port", type=int, default=8090, help="port of the server started without --url")
+    parser.add_argument("--session-workers", type=int, default=0, help="session workers of the started server")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args(arguments)
+
+    server = None
+    url, server_pid = args.url, args.server_pid
+    if url is None:
+        server = start_server(args.port, args.session_workers)
+        url, server_pid = f"ws://127.0.0.1:{args.port}/robotcrane", server.pid
+
+    try:
+        clients = [LoadClient(index, url, parse_mix(args.mix), args.rate, args.format, args.seed)
+                   for index in range(args.clients)]
+        report = asyncio.run(run_load(clients, args.duration, args.ramp, server_pid))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    return 1 if report["failed_clients"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,17 +1,31 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, status
 from fastapi.staticfiles import StaticFiles
 import json
+import logging
+import os
+import time
 
 from starlette.requests import Request
-from starlette.responses import HTMLResponse
+from starlette.responses import HTMLResponse, Response, StreamingResponse
 from starlette.templating import Jinja2Templates
 
 from backend.app.models.RobotCrane import RobotCrane
-from backend.app.services.RobotPoseStreamer import RobotPoseStreamer
-from backend.app.services.tools.RobotUpdateHelper import set_actuator_states, set_end_effectors, set_new_origin, \
-    get_pose, initialize_robot
+from backend.app.services.Metrics import metrics, merge_samples, format_metrics, REJECTED_REQUESTS
+from backend.app.services.MotionRecorder import find_recording, read_index
+from backend.app.services.PlanningExecutor import PlanningExecutor
+from backend.app.services.RobotSession import RobotSession, PoseSubscriber, DEFAULT_STREAMING_RATE
+from backend.app.services.RobotSessionHub import RobotSessionHub
+from backend.app.services.WorkspaceMap import WorkspaceMap
+from backend.app.services.tools.LoggingHelper import configure_logging
+from backend.app.services.tools.RecordingHelper import get_channel_size, parse_byte_range, iter_channel_bytes
+from backend.app.services.tools.RobotUpdateHelper import get_pose, initialize_robot, check_reachability
 from backend.app.views.RobotTask import RobotTask
 from backend.app.views.WebSocketAPI import WebSocketAPI
+from backend.app.views.WireFormat import WireFormat
+
+# Log at the ROBOTCRANE_LOG_LEVEL setting, INFO by default
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Instantiate a webapp
 app = FastAPI()
@@ -28,26 +42,117 @@ async def serve_html(request: Request):
 
 # Backend
 websocket_api = WebSocketAPI()
+planning_executor = PlanningExecutor()
+recordings_path = "backend/data/recordings"
+workspace_map: WorkspaceMap | None = None
+
+# Sessions run in this process, unless worker processes are configured to spread them over multiple cores
+session_hub = RobotSessionHub(planning_executor, recordings_path,
+                              worker_count=int(os.environ.get("ROBOTCRANE_SESSION_WORKERS", 0)))
+
+
+@app.on_event("startup")
+def load_workspace_map():
+    # The map only depends on the robot dimensions, it is built once and memory-mapped on later starts
+    global workspace_map
+    workspace_map = WorkspaceMap.load_or_build(RobotCrane(), "backend/data/workspace")
+
+
+@app.on_event("startup")
+async def start_session_hub():
+    session_hub.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    session_hub.shutdown()
+    planning_executor.shutdown()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics of this process and the session workers, in the Prometheus text format"""
+    samples = merge_samples([metrics.collect(), *await session_hub.collect_worker_metrics()])
+    return Response(format_metrics(samples), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/recordings/{name}")
+async def get_recording_index(name: str):
+    try:
+        return read_index(find_recording(recordings_path, name))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/recordings/{name}/{channel}")
+def get_recording_channel(request: Request, name: str, channel: str):
+    """
+    Raw float64 frames of a channel, laid out as in the index, with support for a single byte range
+    The endpoint runs in the threadpool and the file is streamed in chunks, so a large channel blocks neither the
+    event loop nor memory
+    """
+    try:
+        path = find_recording(recordings_path, name)
+        size = get_channel_size(path, channel)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    headers = {"Accept-Ranges": "bytes"}
+    range_header = request.headers.get("range")
+    if range_header is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_channel_bytes(path, channel, 0, size - 1),
+                                 media_type="application/octet-stream", headers=headers)
+
+    try:
+        first, last = parse_byte_range(range_header, size)
+    except ValueError as e:
+        raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{size}"})
+
+    headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    headers["Content-Length"] = str(last - first + 1)
+    return StreamingResponse(iter_channel_bytes(path, channel, first, last), status_code=206,
+                             media_type="application/octet-stream", headers=headers)
 
 
 @app.websocket("/robotcrane")
 async def websocket_endpoint(websocket: WebSocket):
+    await serve_session(websocket, session_hub.create_private())
+
+
+@app.websocket("/robotcrane/{session_name}")
+async def shared_websocket_endpoint(websocket: WebSocket, session_name: str):
+    try:
+        session = session_hub.join(session_name)
+    except ValueError as e:
+        logger.warning("Rejected session %s: %s", session_name, e)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await serve_session(websocket, session)
+
+
+async def serve_session(websocket: WebSocket, session: RobotSession):
     await websocket_api.connect(websocket)
 
-    robot = RobotCrane()
+    subscriber = session.subscribe(websocket, websocket_api)
 
     try:
         while True:
-            robot = await process_request(robot, websocket)
+            await process_request(session, subscriber, websocket)
 
     except WebSocketDisconnect:
         websocket_api.disconnect(websocket)
 
+    finally:
+        session.unsubscribe(subscriber)
+        session_hub.release(session)
+
 
-async def process_request(robot: RobotCrane, websocket: WebSocket):
+async def process_request(session: RobotSession, subscriber: PoseSubscriber, websocket: WebSocket):
     try:
         data = await websocket_api.receive_message(websocket)
-        print(f"Message received from client: {data}")
+        logger.debug("Message received from client: %s", data)
 
         # Convert request to json
         json_data = json.loads(data)
@@ -59,43 +164,52 @@ async def process_request(robot: RobotCrane, websocket: WebSocket):
         # Handle action
         match action:
             case RobotTask.initialize_robot:
-                robot = RobotCrane()
-                init_data = initialize_robot(robot)
+                init_options = json_data.get("data") or {}
+                if not isinstance(init_options, dict):
+                    raise ValueError("Initialize options should be an object")
+
+                # Joining a shared session should not reset the robot of the other subscribers
+                if not session.shared:
+                    await session.reset_robot()
+                subscriber.pose_encoder.set_wire_format(WireFormat[init_options.get("format", "json")])
+                session.set_streaming_rate(subscriber, float(init_options.get("rate", DEFAULT_STREAMING_RATE)))
+
+                init_data = initialize_robot(session.robot)
+                init_data["init_robot_data"]["streaming_rate"] = subscriber.target_rate
                 await websocket_api.send_json_message(websocket, init_data)
 
             case RobotTask.reset_robot:
-                robot = RobotCrane()
-                pose = get_pose(robot)
-                await websocket_api.send_json_message(websocket, pose)
-
-            case RobotTask.move_actuators:
-                set_actuator_states(robot, json_data["data"])
-                streamer = RobotPoseStreamer(websocket, websocket_api)
-                await streamer.stream_poses(robot)
-
-            case RobotTask.move_end_effector:
-                set_end_effectors(robot, json_data["data"])
-                streamer = RobotPoseStreamer(websocket, websocket_api)
-                await streamer.stream_poses(robot)
-
-            case RobotTask.move_origin:
-                set_new_origin(robot, json_data["data"])
-                streamer = RobotPoseStreamer(websocket, websocket_api)
-                await streamer.stream_poses_for_new_origin(robot)
-
-            case RobotTask.move_origin_control_end_effector:
-                set_new_origin(robot, json_data["data"])
-                streamer = RobotPoseStreamer(websocket, websocket_api)
-                await streamer.stream_poses_for_new_origin_and_control_end_effector(robot)
+                await session.reset_robot()
+                session.publish(get_pose(session.robot)["pose_data"])
+
+            case RobotTask.check_reachability:
+                reachability_data = check_reachability(workspace_map, session.robot, json_data["data"])
+                await websocket_api.send_json_message(websocket, reachability_data)
+
+            case RobotTask.stop:
+                await session.stop_motion()
+
+            case RobotTask.start_recording:
+                recording_name = f"{session.name}-{int(time.time())}"
+                session.start_recording(os.path.join(recordings_path, recording_name))
+                await websocket_api.send_json_message(websocket, {"recording_data": {"name": recording_name}})
+
+            case RobotTask.stop_recording:
+                session.stop_recording()
+
+            case RobotTask.replay | RobotTask.move_actuators | RobotTask.move_end_effector | \
+                 RobotTask.move_end_effector_linear | RobotTask.move_path | RobotTask.move_origin | \
+                 RobotTask.move_origin_control_end_effector:
+                await session.move(action, json_data["data"])
 
             case _:
                 raise ValueError("Invalid action")
 
     except KeyError as e:
-        print(f"KeyError: {e}")
+        REJECTED_REQUESTS.inc()
+        logger.warning("Invalid request, missing %s", e)
         await websocket_api.send_message(websocket, f"Invalid request")
     except ValueError as e:
-        print(f"ValueError: {e}")
+        REJECTED_REQUESTS.inc()
+        logger.warning("Invalid request: %s", e)
         await websocket_api.send_message(websocket, f"Invalid request: {e}")
-
-    return robot
@@ -43,4 +43,59 @@ export class Pose {
             json['theta_3']
         )
     }
-}
\ No newline at end of file
+}
+
+/**
+ * Reconstruction of binary pose streams, negotiated with `initialize_robot` and data `{"format": "binary"}`
+ * or `{"format": "delta"}`. Every message starts with a 16 byte little-endian header:
+ *
+ *   uint8 frameType, 3 padding bytes, uint32 sequence, uint64 unix timestamp in milliseconds
+ *
+ * frameType 0 is a full pose (keyframe): 25 float32 values, the xyz of j_1 to j_7 followed by theta_0 to theta_3.
+ * frameType 1 is a delta frame: a uint32 bitmask of the changed values, followed by an int16 per set bit in
+ * ascending bit order. The new value is the previous reconstructed value plus int16 * 1e-5, added in float64.
+ *
+ * The server tracks this exact reconstruction, so quantization errors do not accumulate. Delta frames only apply
+ * to the pose reconstructed from the preceding frames, a delta frame received before any keyframe is ignored.
+ */
+export class PoseStreamDecoder {
+    static readonly headerSize = 16;
+    static readonly recordLength = 25;
+    static readonly deltaQuantum = 1e-5;
+
+    private values?: number[];
+
+    decode(buffer: ArrayBuffer): Pose | undefined {
+        const view = new DataView(buffer);
+        const frameType = view.getUint8(0);
+
+        if (frameType === 0) {
+            this.values = [];
+            for (let i = 0; i < PoseStreamDecoder.recordLength; i++) {
+                this.values.push(view.getFloat32(PoseStreamDecoder.headerSize + i * 4, true));
+            }
+        } else if (frameType === 1 && this.values != null) {
+            const mask = view.getUint32(PoseStreamDecoder.headerSize, true);
+            let offset = PoseStreamDecoder.headerSize + 4;
+            for (let i = 0; i < PoseStreamDecoder.recordLength; i++) {
+                if ((mask >>> i) & 1) {
+                    this.values[i] = this.values[i] + view.getInt16(offset, true) * PoseStreamDecoder.deltaQuantum;
+                    offset += 2;
+                }
+            }
+        } else {
+            return undefined;
+        }
+
+        const v = this.values;
+        return Pose.fromJson({
+            'j_1': v.slice(0, 3), 'j_2': v.slice(3, 6), 'j_3': v.slice(6, 9), 'j_4': v.slice(9, 12),
+            'j_5': v.slice(12, 15), 'j_6': v.slice(15, 18), 'j_7': v.slice(18, 21),
+            'theta_0': v[21], 'theta_1': v[22], 'theta_2': v[23], 'theta_3': v[24]
+        });
+    }
+
+    static sequence(buffer: ArrayBuffer): number {
+        return new DataView(buffer).getUint32(4, true);
+    }
+}